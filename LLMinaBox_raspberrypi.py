@@ -1,14 +1,23 @@
+from startup import StartupTimer, Deferred, preload
+timer = StartupTimer()
+
 import os
-import time
-import requests
-import speech_recognition as sr
-from typing import IO
-from io import BytesIO
-from elevenlabs import VoiceSettings
-from elevenlabs.client import ElevenLabs
+import signal
+import threading
 from dotenv import load_dotenv
-import pygame
-import RPi.GPIO as GPIO
+
+from gpio_button import Button, load_gpio
+from pipeline import Pipeline
+from stt import GoogleSTT
+from llm import LLMinaBoxLLM, OllamaLLM
+from router import LLMRouter
+from tts import ElevenLabsTTS
+from tts_cache import CachedTTS
+from conversation_log import ConversationLog
+from conversation import ConversationContext
+from tracing import TurnTracer
+
+timer.mark("imports")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,114 +25,61 @@ load_dotenv()
 # Retrieve the API keys from environment variables
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 LLMINABOX_API_URL = os.getenv("LLMINABOX_API_URL")
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/chat")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b")
 
-# Initialize Eleven Labs client
-eleven_labs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-
-# GPIO setup for button
+# Button on BCM pin 17 (GPIO_BACKEND=fake to try it without a Pi)
 BUTTON_PIN = 17
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+GPIO = load_gpio()
 
-# Function to convert text to speech and return as audio stream
-def text_to_speech_stream(text: str) -> IO[bytes]:
-    start_time = time.time()
-    # Perform the text-to-speech conversion
-    response = eleven_labs_client.text_to_speech.convert_as_stream(
-        voice_id="jBpfuIE2acCO8z3wKNLl",  # Adam pre-made voice
-        output_format="mp3_22050_32",
-        optimize_streaming_latency="4",
-        text=text,
-        model_id="eleven_turbo_v2_5",
-        voice_settings=VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-        ),
+# Main loop to wait for button press and process the input
+def main():
+    # Clients are built in the background while we already wait for the button
+    stt = Deferred("Google STT", GoogleSTT, timer)
+    tts = Deferred("ElevenLabs client", lambda: ElevenLabsTTS(api_key=ELEVENLABS_API_KEY), timer)
+    # Every spoken turn is logged locally and synced to LLM in a Box
+    log = ConversationLog()
+    pipeline = Pipeline(
+        stt=stt,
+        # Fall back to the local Ollama when LLM in a Box is slow or down
+        llm=LLMRouter([
+            LLMinaBoxLLM(api_url=LLMINABOX_API_URL),
+            OllamaLLM(api_url=OLLAMA_API_URL, model=OLLAMA_MODEL),
+        ]),
+        tts=CachedTTS(tts),
+        on_turn_end=log.append,
+        # Remember earlier exchanges within a token budget
+        conversation=ConversationContext(),
+        # Per-turn latency traces and p50/p95 metrics
+        tracer=TurnTracer(),
     )
+    pipeline.start()
+    preload([stt, tts], timer)
 
-    # Create a BytesIO object to hold the audio data in memory
-    audio_stream = BytesIO()
+    listening = threading.Lock()
 
-    # Write each chunk of audio data to the stream
-    for chunk in response:
-        if chunk:
-            audio_stream.write(chunk)
-
-    # Reset stream position to the beginning
-    audio_stream.seek(0)
-
-    # Return the stream for further use
-    return audio_stream
-
-# Function to recognize speech
-def recognize_speech():
-    recognizer = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("Listening...")
-        audio = recognizer.listen(source)
+    def listen():
+        # A press while the microphone is already open is ignored
+        if not listening.acquire(blocking=False):
+            return
         try:
-            text = recognizer.recognize_google(audio)
-            print(f"Recognized: {text}")
-            return text
-        except Exception as e:
-            print(f"Error: {str(e)}")
-            return None
-
-# Function to send text to LLMinaBox API and get the response
-def send_to_LLMinBox(user_input):
-    payload = {"question": user_input}
-    try:
-        response = requests.post(LLMINABOX_API_URL, json=payload, stream=True)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        print(f"Response status code: {response.status_code}")
-
-        # Try to parse the JSON response
-        json_response = response.json()
-
-        # Extract the text from the response
-        response_text = json_response.get('text', 'No text field in JSON')
-        return response_text
-    except requests.exceptions.RequestException as req_err:
-        print(f"Request to LLMinaBox failed: {req_err}")
-        return f"Error: Failed to connect to LLMinaBox. {str(req_err)}"
-
-# Function to play audio from a BytesIO stream
-def play_audio(audio_stream):
-    # Initialize pygame mixer
-    pygame.mixer.init()
-
-    # Load the audio stream into pygame
-    pygame.mixer.music.load(audio_stream)
-
-    # Play the audio
-    pygame.mixer.music.play()
-
-    # Wait for the audio to finish playing
-    while pygame.mixer.music.get_busy():
-        time.sleep(0.1)
-
-# Main loop to wait for button press and process the input
-def main():
+            # The reply streams through the pipeline threads; pressing the
+            # button again while Immy talks interrupts her
+            pipeline.listen_and_respond()
+        finally:
+            listening.release()
+
+    def forget():
+        pipeline.conversation.clear()
+        print("Starting a new conversation")
+
+    # Click to talk (taken on release, so a hold is never also a turn), hold to start a new conversation
+    Button(BUTTON_PIN, GPIO, on_press=listen, on_long_press=forget)
     print("Waiting for button press...")
+    timer.responsive()
 
-    while True:
-        # Detect button press (falling edge)
-        if GPIO.input(BUTTON_PIN) == GPIO.LOW:
-            user_input = recognize_speech()
-            if user_input:
-                response_text = send_to_LLMinBox(user_input)
-                print("LLMinaBox response:", response_text)
-                if not response_text.startswith("Error:"):
-                    # Send the response_text directly to ElevenLabs for TTS
-                    audio_stream = text_to_speech_stream(response_text)
-                    play_audio(audio_stream)
-                else:
-                    print("Skipping text-to-speech due to error in LLMinaBox response")
-
-        time.sleep(0.1)
+    # Presses arrive as GPIO interrupts; nothing to do here until Ctrl+C
+    signal.pause()
 
 if __name__ == "__main__":
     try:
@@ -131,4 +87,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("Script interrupted by user")
     finally:
-        GPIO.cleanup()
\ No newline at end of file
+        GPIO.cleanup()
@@ -0,0 +1,219 @@
+"""Gapless streaming playback of 16-bit mono PCM.
+
+TTS backends write raw PCM into a fixed-size ring buffer and a PyAudio
+callback stream pulls from it, so playback starts as soon as one callback
+period of audio has arrived and later sentences are appended to the same
+stream without re-initialising a decoder between them.
+"""
+import threading
+
+SAMPLE_WIDTH = 2  # bytes per 16-bit sample
+
+# PortAudio callback return codes, so pyaudio is only imported when the device opens
+PA_CONTINUE = 0
+PA_COMPLETE = 1
+
+
+class RingBuffer:
+    """Bounded byte FIFO backed by one preallocated bytearray"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self._read_pos = 0
+        self._size = 0
+        # Most bytes ever buffered at once
+        self.high_water = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def write(self, chunk):
+        """Append chunk, blocking while the buffer is full"""
+        view = memoryview(chunk)
+        while len(view):
+            with self._cond:
+                self._cond.wait_for(lambda: self._size < self.capacity or self._closed)
+                if self._closed:
+                    return
+                count = min(len(view), self.capacity - self._size)
+                start = (self._read_pos + self._size) % self.capacity
+                first = min(count, self.capacity - start)
+                self._data[start:start + first] = view[:first]
+                self._data[:count - first] = view[first:count]
+                self._size += count
+                self.high_water = max(self.high_water, self._size)
+                self._cond.notify_all()
+            view = view[count:]
+
+    def read(self, count):
+        """Remove and return up to count bytes without blocking"""
+        with self._cond:
+            count = min(count, self._size)
+            start = self._read_pos
+            first = min(count, self.capacity - start)
+            out = bytes(self._data[start:start + first]) + bytes(self._data[:count - first])
+            self._read_pos = (start + count) % self.capacity
+            self._size -= count
+            self._cond.notify_all()
+            return out
+
+    def clear(self):
+        with self._cond:
+            self._read_pos = 0
+            self._size = 0
+            self._cond.notify_all()
+
+    def close(self):
+        """Wake up and release any blocked writer"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AudioStreamPlayer:
+    def __init__(self, sample_rate=22050, buffer_seconds=10, frames_per_buffer=1024):
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.ring = RingBuffer(sample_rate * SAMPLE_WIDTH * buffer_seconds)
+
+        # Playback starts once one callback period of audio is buffered
+        self.prebuffer_bytes = frames_per_buffer * SAMPLE_WIDTH
+
+        self.is_playing = False
+        self.underruns = 0
+        self._starved = False
+        self._finished = True
+        self._state = threading.Condition()
+        self._audio = None
+        self._stream = None
+        self._opened = threading.Event()
+
+    def start(self):
+        """Open the output device in the background; playback begins when audio arrives"""
+        threading.Thread(target=self._open, daemon=True).start()
+
+    def _open(self):
+        # PortAudio probes every device on init, which is slow on the Pi
+        try:
+            import pyaudio
+
+            self._audio = pyaudio.PyAudio()
+            self._stream = self._audio.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=self.sample_rate,
+                output=True,
+                frames_per_buffer=self.frames_per_buffer,
+                stream_callback=self._callback,
+                start=False,
+            )
+        except Exception as e:
+            print(f"Error opening audio output: {e}")
+            self._stream = None
+        finally:
+            self._opened.set()
+        if self._stream is None:
+            # Release a writer that filled the ring while the device was opening
+            self._discard()
+
+    def add_audio_chunk(self, chunk):
+        """Append PCM to the stream, blocking while the ring buffer is full"""
+        if not chunk:
+            return
+        if self._opened.is_set() and self._stream is None:
+            # No output device: drop the audio so the turn still finishes
+            return
+        with self._state:
+            self._finished = False
+        self.ring.write(chunk)
+        if len(self.ring) >= self.prebuffer_bytes:
+            self._ensure_playing()
+
+    def finish(self):
+        """Mark the end of the current audio so the tail is played out"""
+        with self._state:
+            self._finished = True
+            has_audio = len(self.ring) > 0
+        if has_audio:
+            self._ensure_playing()
+
+    def interrupt(self):
+        """Drop buffered audio; playback stops within one callback period"""
+        self.ring.clear()
+        with self._state:
+            self._finished = True
+
+    def wait_until_done(self, timeout=None):
+        """Block until everything written so far has been played"""
+        self.finish()
+        with self._state:
+            return self._state.wait_for(lambda: not self.is_playing, timeout)
+
+    def _ensure_playing(self):
+        self._opened.wait()
+        if self._stream is None:
+            self._discard()
+            return
+        with self._state:
+            if self.is_playing:
+                return
+            self.is_playing = True
+            self._starved = False
+        # A stream that completed on its own must be stopped before restarting
+        if not self._stream.is_stopped():
+            self._stream.stop_stream()
+        self._stream.start_stream()
+
+    def _discard(self):
+        """Consume buffered audio as if it had been played"""
+        self.ring.clear()
+        with self._state:
+            self._finished = True
+            self.is_playing = False
+            self._state.notify_all()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        wanted = frame_count * SAMPLE_WIDTH
+        # Read whole samples only so silence padding never shifts alignment
+        available = len(self.ring)
+        data = self.ring.read(min(wanted, available - available % SAMPLE_WIDTH))
+        if len(data) == wanted:
+            self._starved = False
+            return data, PA_CONTINUE
+
+        # Pad with silence; only count it when more audio was expected
+        data += bytes(wanted - len(data))
+        with self._state:
+            if self._finished and len(self.ring) < SAMPLE_WIDTH:
+                self.ring.clear()
+                self.is_playing = False
+                self._state.notify_all()
+                return data, PA_COMPLETE
+            if not self._starved:
+                self.underruns += 1
+                self._starved = True
+        return data, PA_CONTINUE
+
+    def stats(self):
+        return {
+            "buffered_bytes": len(self.ring),
+            "capacity_bytes": self.ring.capacity,
+            "high_water_bytes": self.ring.high_water,
+            "underruns": self.underruns,
+        }
+
+    def stop(self):
+        """Stop playback and close the output device"""
+        self.ring.close()
+        with self._state:
+            self._finished = True
+            self.is_playing = False
+            self._state.notify_all()
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+        if self._audio is not None:
+            self._audio.terminate()
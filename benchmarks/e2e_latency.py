@@ -0,0 +1,315 @@
+"""End-to-end turn latency per entry-point configuration, without mic, speaker or network.
+
+Recorded WAV utterances are replayed in real time in place of the microphone
+and go through the same VAD endpointing as a live capture. The LLM and TTS
+backends are the real ones from llm.py and tts.py, pointed at the local
+stand-ins in fake_services.py, and audio goes to a null sink that plays it
+in real time. Each configuration runs in its own process so its CPU time and
+peak RSS are its own:
+
+    groq       Groq.py, Groq_raseberrypi_ver1.py: Groq (Ollama fallback) + ElevenLabs
+    llminabox  LLMinAbox.py, LLMinaBox_raspberrypi.py, nobutton.py: LLM in a Box + ElevenLabs
+    offline    offline.py: Whisper (if installed) + Ollama + espeak/pyttsx3
+
+Reports time to first audio (from the end of speech), total turn time (from
+the start of listening), CPU seconds per turn, peak RSS and the most
+synthesized audio buffered at once.
+
+    python benchmarks/e2e_latency.py [--configs groq llminabox offline] [--turns 5]
+        [--wav utterance.wav ...] [--first-token-delay 0.25] [--token-delay 0.03]
+        [--audio-first-byte 0.2] [--audio-rtf 0.3] [--stream-box]
+
+A WAV's transcript is read from a .txt file next to it; without --wav a
+synthetic voiced utterance is generated.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_TRANSCRIPT = "Tell me a story about a dragon."
+CAPTURE_RATE = 16000
+CAPTURE_CHUNK = 512
+
+
+def read_wav(path):
+    """The WAV as float32 mono samples at the capture rate"""
+    import numpy as np
+
+    with wave.open(path, "rb") as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+    samples = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+    if width == 1:
+        samples = samples - 128
+    samples /= float(2 ** (8 * width - 1))
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != CAPTURE_RATE:
+        positions = np.arange(0, len(samples) - 1, rate / CAPTURE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples.astype(np.float32)
+
+
+def synthetic_utterance(path):
+    """Half a second of room noise, 1.5 s of a voiced sound, then a second of noise"""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(1.5 * CAPTURE_RATE)) / CAPTURE_RATE
+    voiced = sum(np.sin(2 * np.pi * 140 * harmonic * t) / harmonic for harmonic in range(1, 6))
+    voiced *= 0.3 * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))  # syllable-like envelope
+    noise = lambda seconds: rng.normal(0, 0.002, int(seconds * CAPTURE_RATE))
+    samples = np.concatenate((noise(0.5), voiced + noise(1.5), noise(1.0)))
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(CAPTURE_RATE)
+        wav.writeframes(pcm.tobytes())
+
+
+class ReplayCapture:
+    """Stands in for the shared AudioCapture: every listen() replays the next utterance in real time"""
+
+    sample_rate = CAPTURE_RATE
+
+    def __init__(self, utterances):
+        self.utterances = utterances
+        self.turn = 0
+
+    def listen(self, pre_roll=0.0):
+        import numpy as np
+
+        samples, _ = self.utterances[self.turn % len(self.utterances)]
+        self.turn += 1
+        started = time.monotonic()
+        position = 0
+        while True:
+            # Block until the samples would have been captured
+            time.sleep(max(0.0, started + (position + CAPTURE_CHUNK) / CAPTURE_RATE - time.monotonic()))
+            block = samples[position:position + CAPTURE_CHUNK]
+            position += CAPTURE_CHUNK
+            if len(block) < CAPTURE_CHUNK:
+                # Past the end of the recording: silence
+                block = np.concatenate((block, np.zeros(CAPTURE_CHUNK - len(block), dtype=np.float32)))
+            yield block
+
+
+class ReplaySTT:
+    """Online recognizer stand-in: VAD-endpointed real-time replay, then the known transcript
+
+    ``recognition_delay`` stands for the cloud recognizer's round trip.
+    """
+
+    def __init__(self, utterances, recognition_delay=0.4):
+        from vad import Endpointer
+
+        self.Endpointer = Endpointer
+        self.capture = ReplayCapture(utterances)
+        self.recognition_delay = recognition_delay
+        self.capture_seconds = None
+
+    def recognize(self, on_partial=None):
+        started = time.monotonic()
+        transcript = self.capture.utterances[self.capture.turn % len(self.capture.utterances)][1]
+        endpointer = self.Endpointer(sample_rate=CAPTURE_RATE)
+        for block in self.capture.listen():
+            if endpointer.process(block):
+                break
+        self.capture_seconds = time.monotonic() - started
+        time.sleep(self.recognition_delay)
+        return transcript if endpointer.audio() is not None else None
+
+
+class NullPlayer:
+    """Audio sink that keeps real-time playback timing and discards the samples"""
+
+    def __init__(self, sample_rate=22050):
+        self.bytes_per_second = sample_rate * 2
+        self.ends_at = 0.0
+
+    def start(self):
+        pass
+
+    def add_audio_chunk(self, chunk):
+        now = time.monotonic()
+        self.ends_at = max(self.ends_at, now) + len(chunk) / self.bytes_per_second
+
+    def interrupt(self):
+        self.ends_at = time.monotonic()
+
+    def wait_until_done(self, timeout=None):
+        time.sleep(max(0.0, self.ends_at - time.monotonic()))
+        return True
+
+    def stop(self):
+        pass
+
+
+def build_pipeline(config, url, utterances):
+    from pipeline import Pipeline
+    from conversation import ConversationContext
+    from llm import GroqLLM, LLMinaBoxLLM, OllamaLLM
+    from router import LLMRouter
+
+    ollama = OllamaLLM(api_url=f"{url}/api/chat")
+    if config == "groq":
+        from tts import ElevenLabsTTS
+
+        stt = ReplaySTT(utterances)
+        llm = LLMRouter([GroqLLM(api_key="bench", base_url=url), ollama])
+        tts = ElevenLabsTTS(api_key="bench", base_url=url)
+    elif config == "llminabox":
+        from tts import ElevenLabsTTS
+
+        stt = ReplaySTT(utterances)
+        llm = LLMRouter([LLMinaBoxLLM(api_url=f"{url}/ask"), ollama])
+        tts = ElevenLabsTTS(api_key="bench", base_url=url)
+    elif config == "offline":
+        from tts import Pyttsx3TTS
+
+        try:
+            from stt import WhisperSTT
+
+            stt = WhisperSTT("base", capture=ReplayCapture(utterances))
+        except ImportError as e:
+            print(f"Whisper unavailable ({e}), replaying transcripts instead", file=sys.stderr)
+            stt = ReplaySTT(utterances, recognition_delay=0.0)
+        llm = ollama
+        tts = Pyttsx3TTS(rate=150, volume=0.9)
+    else:
+        raise ValueError(f"unknown configuration {config}")
+
+    # The synthesis cache is left out: every turn repeats the same reply
+    return Pipeline(stt=stt, llm=llm, tts=tts, player=NullPlayer(), conversation=ConversationContext())
+
+
+def run_child(args):
+    """Runs one configuration and prints its results as JSON"""
+    utterances = []
+    for path in args.wav:
+        transcript_path = os.path.splitext(path)[0] + ".txt"
+        transcript = DEFAULT_TRANSCRIPT
+        if os.path.exists(transcript_path):
+            with open(transcript_path) as f:
+                transcript = f.read().strip()
+        utterances.append((read_wav(path), transcript))
+
+    try:
+        pipeline = build_pipeline(args.child, args.url, utterances)
+    except ImportError as e:
+        print(json.dumps({"skipped": str(e)}))
+        return
+    pipeline.start()
+
+    first_audio, totals = [], []
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    for _ in range(args.turns):
+        turn = pipeline.listen_and_respond()
+        if turn is None:
+            continue
+        turn.wait()
+        timings = turn.timings
+        if "playback_start" in timings:
+            speech_end = timings.get("capture_end", timings.get("stt_end", 0.0))
+            first_audio.append(timings["playback_start"] - speech_end)
+        if "playback_end" in timings:
+            totals.append(timings["playback_end"])
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_start
+    buffers = pipeline.stats()
+    pipeline.close()
+
+    print(json.dumps({
+        "turns": len(totals),
+        "first_audio": first_audio,
+        "total": totals,
+        "cpu_per_turn": cpu / max(1, len(totals)),
+        "peak_rss_mb": usage.ru_maxrss / 1024,  # kilobytes on Linux
+        "audio_buffer_kb": buffers["audio"]["high_water_bytes"] / 1024,
+    }))
+
+
+def percentile(values, quantile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--configs", nargs="+", default=["groq", "llminabox", "offline"])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--wav", nargs="*", default=[], help="recorded utterances (16-bit PCM WAV)")
+    parser.add_argument("--first-token-delay", type=float, default=0.25)
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--audio-first-byte", type=float, default=0.2)
+    parser.add_argument("--audio-rtf", type=float, default=0.3, help="speech generation time per second of audio")
+    parser.add_argument("--stream-box", action="store_true", help="LLM in a Box streams NDJSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from fake_services import FakeServices
+
+    services = FakeServices(
+        first_token_delay=args.first_token_delay,
+        token_delay=args.token_delay,
+        audio_first_byte=args.audio_first_byte,
+        audio_rtf=args.audio_rtf,
+        stream_box=args.stream_box,
+    ).start()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wavs = args.wav
+        if not wavs:
+            wavs = [os.path.join(temp_dir, "utterance.wav")]
+            synthetic_utterance(wavs[0])
+
+        # Keep the benchmark's traces, logs and caches out of the real ones
+        env = dict(os.environ, TRACE_DIR=temp_dir, CONVERSATION_LOG_DIR=temp_dir, TTS_CACHE_DIR=temp_dir)
+        print(f"{'config':<12}{'turns':>6}{'first audio p50':>17}{'p95':>8}{'total p50':>11}"
+              f"{'CPU s/turn':>12}{'peak RSS MB':>13}{'audio buf KB':>14}")
+        for config in args.configs:
+            command = [sys.executable, os.path.abspath(__file__), "--child", config, "--url", services.url,
+                       "--turns", str(args.turns), "--wav", *wavs]
+            output = subprocess.run(command, capture_output=True, text=True, env=env)
+            lines = output.stdout.strip().splitlines()
+            try:
+                result = json.loads(lines[-1])
+            except (IndexError, ValueError):
+                print(f"{config:<12}failed: {output.stderr.strip().splitlines()[-1:]}")
+                continue
+            if "skipped" in result:
+                print(f"{config:<12}skipped: {result['skipped']}")
+                continue
+            if not result["total"]:
+                print(f"{config:<12}no completed turns")
+                continue
+            print(f"{config:<12}{result['turns']:>6}"
+                  f"{statistics.median(result['first_audio']) * 1000:>14.0f} ms"
+                  f"{percentile(result['first_audio'], 0.95) * 1000:>5.0f} ms"
+                  f"{statistics.median(result['total']):>9.2f} s"
+                  f"{result['cpu_per_turn']:>12.3f}{result['peak_rss_mb']:>13.1f}"
+                  f"{result['audio_buffer_kb']:>14.0f}")
+
+    services.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Local stand-ins for the Groq, LLM in a Box, Ollama and ElevenLabs APIs.
+
+One HTTP server answers the routes the backends in llm.py and tts.py use,
+with configurable pacing so a benchmark sees realistic arrival patterns
+without touching the network:
+
+- POST /openai/v1/chat/completions  Groq, OpenAI-style server-sent events
+- POST /ask                         LLM in a Box, one JSON body (or NDJSON with stream_box)
+- POST /api/chat                    Ollama, NDJSON (and the non-streamed warmup)
+- GET  /api/ps, /api/tags           Ollama residency and health
+- POST /v1/text-to-speech/<voice>/stream   ElevenLabs, raw 16-bit PCM
+
+Tokens arrive ``first_token_delay`` after the request and then every
+``token_delay`` seconds. Speech arrives ``audio_first_byte`` after the request,
+``SECONDS_PER_CHAR`` of audio per character of text, generated at
+``audio_rtf`` times real time.
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Once upon a time, a little dragon named Pip lived in a cosy cave. "
+    "Pip loved to count the stars every night. "
+    "One evening a star winked back, and they became the best of friends!"
+)
+
+SAMPLE_RATE = 22050
+SECONDS_PER_CHAR = 0.06
+AUDIO_CHUNK = 4096
+
+
+class FakeServices:
+    def __init__(self, reply=DEFAULT_REPLY, first_token_delay=0.25, token_delay=0.03,
+                 audio_first_byte=0.2, audio_rtf=0.3, stream_box=False, host="127.0.0.1", port=0):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.audio_first_byte = audio_first_byte
+        self.audio_rtf = audio_rtf
+        self.stream_box = stream_box
+
+        services = self
+
+        class Handler(_Handler):
+            pass
+
+        Handler.services = services
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tokens(self):
+        """The reply split the way an LLM streams it: words with their leading space"""
+        words = self.reply.split(" ")
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    services = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith("/api/ps"):
+            self._json({"models": [{"name": "qwen2.5:0.5b"}]})
+        elif self.path.startswith("/api/tags"):
+            self._json({"models": [{"name": "qwen2.5:0.5b"}]})
+        else:
+            self._json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        request = json.loads(body) if body else {}
+        path = self.path.split("?")[0]
+
+        if path == "/openai/v1/chat/completions":
+            self._groq()
+        elif path == "/ask":
+            self._box()
+        elif path == "/api/chat":
+            self._ollama(request)
+        elif path.startswith("/v1/text-to-speech/"):
+            self._speech(request.get("text", ""))
+        else:
+            self._json({"error": "not found"}, status=404)
+
+    # LLMs
+
+    def _paced_tokens(self):
+        services = self.services
+        time.sleep(services.first_token_delay)
+        for index, token in enumerate(services.tokens()):
+            if index:
+                time.sleep(services.token_delay)
+            yield token
+
+    def _groq(self):
+        self._start_chunked("text/event-stream")
+        for token in self._paced_tokens():
+            chunk = {
+                "id": "bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": "bench", "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self._chunk(f"data: {json.dumps(chunk)}\n\n")
+        done = {
+            "id": "bench", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": "bench", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        self._chunk(f"data: {json.dumps(done)}\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _box(self):
+        if not self.services.stream_box:
+            # The real server answers with the whole reply at once
+            text = "".join(self._paced_tokens())
+            self._json({"text": text})
+            return
+        self._start_chunked("application/x-ndjson")
+        for token in self._paced_tokens():
+            self._chunk(json.dumps({"text": token}) + "\n")
+        self._chunk(json.dumps({"done": True}) + "\n")
+        self._end_chunked()
+
+    def _ollama(self, request):
+        if not request.get("stream", True):
+            self._json({"message": {"role": "assistant", "content": "Hi"}, "done": True})
+            return
+        self._start_chunked("application/x-ndjson")
+        for token in self._paced_tokens():
+            self._chunk(json.dumps({"message": {"role": "assistant", "content": token}, "done": False}) + "\n")
+        self._chunk(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True,
+                                "load_duration": 1_000_000}) + "\n")
+        self._end_chunked()
+
+    # TTS
+
+    def _speech(self, text):
+        services = self.services
+        total = int(len(text) * SECONDS_PER_CHAR * SAMPLE_RATE) * 2
+        self._start_chunked("application/octet-stream")
+        time.sleep(services.audio_first_byte)
+        sent = 0
+        while sent < total:
+            size = min(AUDIO_CHUNK, total - sent)
+            self._chunk(bytes(size))
+            sent += size
+            time.sleep(size / 2 / SAMPLE_RATE * services.audio_rtf)
+        self._end_chunked()
+
+    # HTTP plumbing
+
+    def _json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
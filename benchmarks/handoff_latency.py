@@ -0,0 +1,132 @@
+"""Compare sleep-polling and blocking handoff between the pipeline stages.
+
+Runs without audio hardware or network: each "sentence" is handed from a
+producer (the LLM) to a TTS stage and on to a player that "plays" a clip of
+fixed length, once with the old ``queue.empty()`` / ``time.sleep(0.1)`` /
+``get_busy()`` loops and once with blocking ``get()`` calls and one timed
+wait per clip.
+
+Both designs are models of the handoff, not the real classes: pipeline.py
+now passes text through a ``BoundedBuffer`` and audio_player.py is a
+callback-driven ring buffer with no waits at all, so the "blocking" numbers
+are an upper bound on what those add. e2e_latency.py measures the real
+pipeline.
+
+Reports the scheduling latency added per sentence and the CPU burnt while the
+pipeline sits idle.
+
+    python benchmarks/handoff_latency.py [--sentences 20] [--clip 0.35] [--idle 5]
+"""
+import argparse
+import queue
+import statistics
+import threading
+import time
+
+POLL_INTERVAL = 0.1
+
+
+class _Clock:
+    """Fake mixer: a clip is 'busy' for a fixed time after play()"""
+
+    def __init__(self, clip):
+        self.clip = clip
+        self.ends_at = 0.0
+
+    def play(self):
+        self.ends_at = time.perf_counter() + self.clip
+
+    def get_busy(self):
+        return time.perf_counter() < self.ends_at
+
+
+def polling_pipeline(text_queue, done, clip, stop):
+    """The loops from the original Groq.py"""
+    audio_queue = queue.Queue()
+    mixer = _Clock(clip)
+
+    def tts():
+        while not stop.is_set():
+            while not text_queue.empty():
+                audio_queue.put(text_queue.get())
+            time.sleep(POLL_INTERVAL)
+
+    def player():
+        while not stop.is_set():
+            if not audio_queue.empty():
+                sent_at = audio_queue.get()
+                mixer.play()
+                while mixer.get_busy():
+                    time.sleep(POLL_INTERVAL)
+                done.put(time.perf_counter() - sent_at - clip)
+            time.sleep(POLL_INTERVAL)
+
+    return [threading.Thread(target=tts, daemon=True), threading.Thread(target=player, daemon=True)]
+
+
+def blocking_pipeline(text_queue, done, clip, stop):
+    """Blocking get() handoff and a single timed wait per clip, standing in for
+    the event-driven stages of pipeline.py and audio_player.py"""
+    audio_queue = queue.Queue()
+
+    def tts():
+        while True:
+            item = text_queue.get()
+            audio_queue.put(item)
+            if item is None:
+                break
+
+    def player():
+        while True:
+            sent_at = audio_queue.get()
+            if sent_at is None:
+                break
+            if stop.wait(clip):
+                break
+            done.put(time.perf_counter() - sent_at - clip)
+
+    return [threading.Thread(target=tts, daemon=True), threading.Thread(target=player, daemon=True)]
+
+
+def measure(build, sentences, clip, idle):
+    text_queue = queue.Queue()
+    done = queue.Queue()
+    stop = threading.Event()
+    threads = build(text_queue, done, clip, stop)
+    for thread in threads:
+        thread.start()
+
+    # Idle CPU: nothing to say for `idle` seconds
+    cpu_start = time.process_time()
+    time.sleep(idle)
+    idle_cpu = (time.process_time() - cpu_start) / idle * 100
+
+    # Latency: one sentence at a time, as the LLM would produce them
+    latencies = []
+    for _ in range(sentences):
+        text_queue.put(time.perf_counter())
+        latencies.append(done.get())
+        # Land at a random phase of the poll interval
+        time.sleep(0.037)
+
+    stop.set()
+    text_queue.put(None)
+    return idle_cpu, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sentences", type=int, default=20)
+    parser.add_argument("--clip", type=float, default=0.35, help="seconds of audio per sentence")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds to sample idle CPU")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'idle CPU %':>12}{'added ms p50':>14}{'added ms max':>14}")
+    for name, build in (("polling", polling_pipeline), ("blocking", blocking_pipeline)):
+        idle_cpu, latencies = measure(build, args.sentences, args.clip, args.idle)
+        print(f"{name:<10}{idle_cpu:>12.3f}"
+              f"{statistics.median(latencies) * 1000:>14.1f}{max(latencies) * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Bounded, turn-aware buffers for the text → TTS → audio chain.
+
+Every stage hands work to the next through a ``BoundedBuffer``, which holds
+at most ``max_items`` items and ``max_bytes`` bytes. A producer that finds
+it full blocks, so a slow speaker throttles synthesis and a slow synthesis
+throttles the LLM stream: the backend's reads pause and TCP flow control
+pushes back on the server instead of RSS growing with the length of a story.
+
+A producer waiting on behalf of a turn gives up as soon as the turn is
+cancelled, and ``purge`` drops what an interrupted turn left in a buffer.
+Buffers may share a ``BufferUsage``, which tracks what they hold together
+and its high-water marks; these are reported by ``Pipeline.stats()`` to size
+the limits per device.
+"""
+import time
+import threading
+from collections import deque
+
+# Returned by get() once a buffer has been closed and drained
+CLOSED = object()
+
+
+class BufferUsage:
+    """Items and bytes held by one or more buffers, with their high-water marks"""
+
+    def __init__(self):
+        self.items = 0
+        self.bytes = 0
+        self.high_water_items = 0
+        self.high_water_bytes = 0
+        # Producers that found a buffer full, and how long they were held up
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, size):
+        with self._lock:
+            self.items += items
+            self.bytes += size
+            self.high_water_items = max(self.high_water_items, self.items)
+            self.high_water_bytes = max(self.high_water_bytes, self.bytes)
+
+    def waited(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": self.items,
+                "bytes": self.bytes,
+                "high_water_items": self.high_water_items,
+                "high_water_bytes": self.high_water_bytes,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+class BoundedBuffer:
+    """FIFO bounded by item count and by total size"""
+
+    def __init__(self, max_items=None, max_bytes=None, size=len, usage=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size = size
+        self.usage = usage or BufferUsage()
+        self._items = deque()
+        self._bytes = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _full(self, size):
+        if not self._items:
+            # Always admit one item, however large, so a producer cannot stall forever
+            return False
+        if self.max_items is not None and len(self._items) >= self.max_items:
+            return True
+        return self.max_bytes is not None and self._bytes + size > self.max_bytes
+
+    def put(self, item, cancelled=None):
+        """Append item, blocking while full; False if the buffer closed or ``cancelled`` was set"""
+        size = self.size(item)
+        with self._cond:
+            gave_up = lambda: self._closed or (cancelled is not None and cancelled.is_set())
+            if self._full(size) and not gave_up():
+                started = time.monotonic()
+                self._cond.wait_for(lambda: not self._full(size) or gave_up())
+                self.usage.waited(time.monotonic() - started)
+            if gave_up():
+                return False
+            self._items.append((item, size))
+            self._bytes += size
+            self.usage.add(1, size)
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        """Remove and return the oldest item, or CLOSED once closed and empty"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed)
+            if not self._items:
+                return CLOSED
+            item, size = self._items.popleft()
+            self._bytes -= size
+            self.usage.add(-1, -size)
+            self._cond.notify_all()
+            return item
+
+    def purge(self, predicate):
+        """Drop every item for which predicate is true and wake blocked producers"""
+        with self._cond:
+            kept = deque(entry for entry in self._items if not predicate(entry[0]))
+            dropped = len(self._items) - len(kept)
+            size = self._bytes - sum(size for _, size in kept)
+            self._items = kept
+            self._bytes -= size
+            self.usage.add(-dropped, -size)
+            self._cond.notify_all()
+
+    def close(self, drop=False):
+        """Refuse further items; with drop, also discard what is buffered"""
+        with self._cond:
+            self._closed = True
+            if drop:
+                self.usage.add(-len(self._items), -self._bytes)
+                self._items.clear()
+                self._bytes = 0
+            self._cond.notify_all()
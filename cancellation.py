@@ -0,0 +1,49 @@
+"""Turn-scoped cancellation.
+
+A ``CancelToken`` behaves like the ``threading.Event`` it replaces
+(``is_set``, ``wait``, ``set``) and also runs abort callbacks when it is set.
+Backends register one for the duration of a request, e.g. to shut down the
+socket of a streaming HTTP response, so an interrupted turn stops reading
+from the network at once instead of at its next token.
+"""
+import threading
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def set(self):
+        """Cancel, running every registered callback once"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error while cancelling: {e}")
+
+    def on_cancel(self, callback):
+        """Run callback when cancelled (now if already); returns a function that unregisters it"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
@@ -0,0 +1,127 @@
+"""Always-on microphone capture shared by every speech backend.
+
+Opening the input device costs tens of milliseconds, and whatever the child
+said while it opened was lost. ``AudioCapture`` opens it once and a capture
+thread keeps writing float32 samples into a preallocated NumPy ring buffer.
+Each block is written twice, ``capacity`` samples apart, so any span of up
+to ``capacity`` samples is a single contiguous slice: turns get views into
+the buffer instead of copies, including the pre-roll from just before the
+button press.
+
+A view stays valid for CAPTURE_BUFFER_SECONDS after the audio was captured;
+whoever keeps audio longer must copy it (``Endpointer.audio()`` does).
+"""
+import os
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+BLOCK = 512  # 32 ms per read
+
+
+class AudioCapture:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, sample_rate=SAMPLE_RATE, block=BLOCK, seconds=None, audio=None):
+        self.sample_rate = sample_rate
+        self.block = block
+        seconds = seconds or float(os.getenv("CAPTURE_BUFFER_SECONDS", "30"))
+        self.capacity = int(seconds * sample_rate)
+        self._buffer = np.zeros(2 * self.capacity, dtype=np.float32)
+        # Samples captured since start; the ring holds the last ``capacity`` of them
+        self.position = 0
+        # Times a reader fell so far behind that audio was overwritten before it was read
+        self.overruns = 0
+        # A PyAudio-like object; the real one is created on the capture thread
+        self._audio = audio
+        self._error = None
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @classmethod
+    def shared(cls):
+        """The process-wide capture, started on first use"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls().start()
+            return cls._shared
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            import pyaudio
+
+            if self._audio is None:
+                self._audio = pyaudio.PyAudio()
+            stream = self._audio.open(format=pyaudio.paFloat32, channels=1, rate=self.sample_rate,
+                                      input=True, frames_per_buffer=self.block)
+        except Exception as e:
+            print(f"Error opening microphone: {e}")
+            self._failed(e)
+            return
+        try:
+            while not self._stop.is_set():
+                self._write(np.frombuffer(stream.read(self.block, exception_on_overflow=False), dtype=np.float32))
+        except Exception as e:
+            print(f"Error recording: {e}")
+            self._failed(e)
+        finally:
+            stream.stop_stream()
+            stream.close()
+
+    def _failed(self, error):
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def _write(self, samples):
+        start = self.position % self.capacity
+        first = min(len(samples), self.capacity - start)
+        for offset in (0, self.capacity):
+            self._buffer[offset + start:offset + start + first] = samples[:first]
+            self._buffer[offset:offset + len(samples) - first] = samples[first:]
+        with self._cond:
+            self.position += len(samples)
+            self._cond.notify_all()
+
+    def view(self, start, end):
+        """Samples [start, end) by capture position, without copying"""
+        if end - start > self.capacity or start < self.position - self.capacity:
+            raise ValueError("audio no longer in the capture buffer")
+        offset = start % self.capacity
+        return self._buffer[offset:offset + end - start]
+
+    def listen(self, pre_roll=0.0):
+        """Yield views of the audio as it arrives, starting ``pre_roll`` seconds in the past"""
+        with self._cond:
+            start = max(0, self.position - int(pre_roll * self.sample_rate))
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.position > start or self._error is not None or self._stop.is_set())
+                if self._error is not None:
+                    raise RuntimeError(f"microphone capture failed: {self._error}")
+                if self._stop.is_set():
+                    return
+                end = self.position
+            if end - start > self.capacity:
+                # Too slow to keep up: skip what was overwritten
+                self.overruns += 1
+                start = end - self.capacity
+            yield self.view(start, end)
+            start = end
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        if self._audio is not None:
+            self._audio.terminate()
@@ -0,0 +1,61 @@
+"""Multi-turn conversation memory within a token budget.
+
+``ConversationContext`` keeps the earlier exchanges of a conversation as chat
+messages and hands them to the LLM backend with every new utterance, so Immy
+remembers what was said. History is only ever appended to, and when it grows
+past ``max_tokens`` the oldest exchanges are dropped in one go down to
+``keep_ratio`` of the budget. Between trims the prompt therefore starts with
+exactly the same system prompt and messages as the previous turn, so a server
+that caches the prompt prefix (Ollama while the model stays loaded) only has
+to prefill the new utterance.
+"""
+import os
+import threading
+
+# Rough tokens per message for the chat template around its content
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: about four characters per token for English"""
+    return len(text) // 4 + 1
+
+
+class ConversationContext:
+    def __init__(self, max_tokens=None, keep_ratio=0.6, max_turns=None):
+        self.max_tokens = max_tokens or int(os.getenv("CONVERSATION_MAX_TOKENS", "1024"))
+        self.keep_ratio = keep_ratio
+        self.max_turns = max_turns
+        self._turns = []  # (user message, assistant message, tokens)
+        self._lock = threading.Lock()
+
+    def history(self):
+        """The kept exchanges as chat messages, oldest first"""
+        with self._lock:
+            return [message for user, assistant, _ in self._turns for message in (user, assistant)]
+
+    def add(self, user_input, reply):
+        """Remember one completed exchange"""
+        if not reply:
+            return
+        user = {"role": "user", "content": user_input}
+        assistant = {"role": "assistant", "content": reply}
+        tokens = estimate_tokens(user_input) + estimate_tokens(reply) + 2 * MESSAGE_OVERHEAD
+        with self._lock:
+            self._turns.append((user, assistant, tokens))
+            if self.tokens() > self.max_tokens or (self.max_turns and len(self._turns) > self.max_turns):
+                self._trim()
+
+    def _trim(self):
+        # Drop well below the budget so the prompt prefix stays stable for several turns
+        target = self.max_tokens * self.keep_ratio
+        keep_turns = int(self.max_turns * self.keep_ratio) if self.max_turns else len(self._turns)
+        while self._turns and (self.tokens() > target or len(self._turns) > keep_turns):
+            self._turns.pop(0)
+
+    def tokens(self):
+        return sum(tokens for _, _, tokens in self._turns)
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
@@ -0,0 +1,249 @@
+"""Crash-safe local log of conversation turns, synced to LLM in a Box.
+
+Every spoken turn is appended as one JSON line (chat id, trace id,
+recognized text, reply, error and per-stage timings) to a segment file under
+CONVERSATION_LOG_DIR. Appends are done by a writer thread so the pipeline
+never waits on the SD card; each line is fsynced, and a line torn by a crash
+is skipped when read back. A new segment is started on every run and after
+SEGMENT_BYTES.
+
+An uploader thread sends unsent lines to CONVERSATION_LOG_URL (by default
+LLMINABOX_API_URL) in gzip-compressed batches, and retries with exponential
+backoff while the network is down. What has been acknowledged is tracked in
+a cursor file; every turn carries a unique id and every batch an
+Idempotency-Key, so a batch re-sent after a crash can be deduplicated by the
+server. Uploaded segments are deleted, and when unsent logs exceed
+CONVERSATION_LOG_MAX_MB the oldest segments are dropped.
+
+    log = ConversationLog()
+    pipeline = Pipeline(..., on_turn_end=log.append)
+"""
+import os
+import gzip
+import json
+import time
+import uuid
+import queue
+import hashlib
+import threading
+
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".cache", "immy", "logs")
+
+# A segment is closed and a new one started beyond this size
+SEGMENT_BYTES = 256 * 1024
+
+# Turns per upload request
+BATCH_RECORDS = 100
+
+CURSOR_FILE = "upload_cursor.json"
+
+# Stops the writer thread
+_CLOSE = object()
+
+
+class ConversationLog:
+    def __init__(self, chat_id=None, log_dir=None, upload_url=None, max_bytes=None,
+                 upload_interval=None, max_backoff=300.0):
+        self.chat_id = chat_id or os.getenv("CHAT_ID") or uuid.uuid4().hex
+        self.log_dir = os.path.expanduser(log_dir or os.getenv("CONVERSATION_LOG_DIR", DEFAULT_LOG_DIR))
+        self.upload_url = upload_url or os.getenv("CONVERSATION_LOG_URL") or os.getenv("LLMINABOX_API_URL")
+        self.max_bytes = max_bytes or int(os.getenv("CONVERSATION_LOG_MAX_MB", "20")) * 1024 * 1024
+        self.upload_interval = upload_interval or float(os.getenv("CONVERSATION_LOG_UPLOAD_INTERVAL", "60"))
+        self.max_backoff = max_backoff
+        self.uploaded = 0
+        self.dropped = 0
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        # Rotation, deletion and the cursor are shared by the writer and the uploader
+        self._lock = threading.Lock()
+        segments = self._segments()
+        self._sequence = int(segments[-1].split(".")[0]) + 1 if segments else 0
+        self._file = None
+        self._open_segment()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        if self.upload_url:
+            threading.Thread(target=self._upload_loop, daemon=True).start()
+
+    def append(self, turn):
+        """Queue a finished turn (a pipeline Turn or a dict) for the log; never blocks"""
+        if isinstance(turn, dict):
+            record = dict(turn)
+        else:
+            record = {
+                "trace_id": turn.trace_id,
+                "user": turn.user_input,
+                "reply": turn.response_text,
+                "error": str(turn.error) if turn.error else None,
+                "timings": {stage: round(seconds, 3) for stage, seconds in turn.timings.items()},
+            }
+        record.setdefault("id", uuid.uuid4().hex)
+        record.setdefault("chat_id", self.chat_id)
+        record.setdefault("time", time.time())
+        self._queue.put(record)
+
+    def flush(self):
+        """Ask the uploader to send what it has now"""
+        self._wake.set()
+
+    def close(self):
+        self._queue.put(_CLOSE)
+        self._writer.join()
+        self._stop.set()
+        self._wake.set()
+
+    # Writer
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            if record is _CLOSE:
+                break
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            try:
+                with self._lock:
+                    self._file.write(line.encode("utf-8"))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    if self._file.tell() >= SEGMENT_BYTES:
+                        self._open_segment()
+                    self._enforce_budget()
+            except OSError as e:
+                print(f"Error writing conversation log: {e}")
+        with self._lock:
+            self._file.close()
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        self._active = f"{self._sequence:08d}.jsonl"
+        self._sequence += 1
+        self._file = open(os.path.join(self.log_dir, self._active), "ab")
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.log_dir) if name.endswith(".jsonl"))
+
+    def _enforce_budget(self):
+        sizes = [(name, os.path.getsize(os.path.join(self.log_dir, name))) for name in self._segments()]
+        total = sum(size for _, size in sizes)
+        for name, size in sizes:
+            if total <= self.max_bytes or name == self._active:
+                break
+            os.remove(os.path.join(self.log_dir, name))
+            total -= size
+            self.dropped += 1
+            print(f"Conversation log over budget, dropped unsent segment {name}")
+
+    # Uploader
+
+    def _upload_loop(self):
+        backoff = self.upload_interval
+        while not self._stop.is_set():
+            self._wake.wait(backoff)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                while self._upload_batch():
+                    pass
+                backoff = self.upload_interval
+            except Exception as e:
+                # Offline or the server is unhappy: try again later
+                backoff = min(max(backoff, self.upload_interval) * 2, self.max_backoff)
+                print(f"Conversation log upload failed, retrying in {backoff:.0f}s: {e}")
+
+    def _upload_batch(self):
+        """Send the next batch; returns False when nothing is left to send"""
+        records, cursor = self._read_batch()
+        if not records:
+            return False
+
+        import requests
+
+        ids = [record["id"] for record in records]
+        body = gzip.compress(json.dumps({"turns": records}, ensure_ascii=False).encode("utf-8"))
+        response = requests.post(
+            self.upload_url,
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+                "Idempotency-Key": hashlib.sha256(",".join(ids).encode()).hexdigest(),
+            },
+            timeout=(3.05, 30),
+        )
+        # 409: the server already has this batch
+        if response.status_code != 409:
+            response.raise_for_status()
+
+        with self._lock:
+            self._save_cursor(cursor)
+            self._delete_sent(cursor)
+        self.uploaded += len(records)
+        return True
+
+    def _read_batch(self):
+        with self._lock:
+            segments = self._segments()
+            segment, offset = self._load_cursor()
+            active = self._active
+        records = []
+        for name in segments:
+            if name < segment:
+                continue
+            start = offset if name == segment else 0
+            try:
+                with open(os.path.join(self.log_dir, name), "rb") as f:
+                    f.seek(start)
+                    data = f.read()
+            except OSError:
+                continue  # dropped over budget meanwhile
+            position = start
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    if name == active:
+                        break  # still being written
+                    # Torn by a crash: skip it
+                position += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+                if len(records) >= BATCH_RECORDS:
+                    return records, (name, position)
+            segment, offset = name, position
+        return records, (segment, offset)
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.log_dir, CURSOR_FILE)) as f:
+                cursor = json.load(f)
+            return cursor["segment"], cursor["offset"]
+        except (OSError, ValueError, KeyError):
+            return "", 0
+
+    def _save_cursor(self, cursor):
+        path = os.path.join(self.log_dir, CURSOR_FILE)
+        segment, offset = cursor
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def _delete_sent(self, cursor):
+        segment, _ = cursor
+        for name in self._segments():
+            if name >= segment or name == self._active:
+                break
+            os.remove(os.path.join(self.log_dir, name))
+
+    def stats(self):
+        with self._lock:
+            size = sum(os.path.getsize(os.path.join(self.log_dir, name)) for name in self._segments())
+        return {"chat_id": self.chat_id, "uploaded": self.uploaded, "dropped": self.dropped, "disk_bytes": size}
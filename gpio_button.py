@@ -0,0 +1,293 @@
+"""Edge-triggered push button with debouncing and press gestures.
+
+``Button`` asks the GPIO library for an interrupt on both edges of the pin
+instead of polling it, so a press is seen as soon as the contact closes and
+nothing runs while nobody touches the bear. The first edge after a quiet
+period is taken at once; the bounces that follow within ``debounce`` seconds
+are ignored and the level is read again once they have settled.
+
+Gestures, each passed to its own handler on a new thread so a handler that
+blocks (listening, for one) never holds up the button:
+
+    press         the button went down, and the press can no longer turn
+                  into one of the gestures below
+    double press  it went down again within ``double_press`` seconds
+    long press    it has been held for ``long_press`` seconds
+
+Each press is reported as exactly one gesture. Without double or long press
+handlers a press is reported as soon as the button goes down; with a long
+press handler, when it is released early enough; with a double press
+handler, once the double press window has passed. ``FakeGPIO`` implements
+the part of RPi.GPIO used here so the loop runs on any Linux box;
+GPIO_BACKEND=fake selects it, with presses typed on the keyboard, and
+``python gpio_button.py`` checks the gestures against it.
+"""
+import os
+import sys
+import time
+import queue
+import threading
+
+# Stops the edge thread
+_STOP = object()
+
+
+def load_gpio():
+    """RPi.GPIO, or a keyboard-driven FakeGPIO when GPIO_BACKEND=fake"""
+    if os.getenv("GPIO_BACKEND", "rpi") == "fake":
+        return FakeGPIO(keyboard=True)
+    import RPi.GPIO as GPIO
+
+    return GPIO
+
+
+class Button:
+    def __init__(self, pin, gpio, on_press=None, on_double_press=None, on_long_press=None,
+                 debounce=None, double_press=None, long_press=None, pull_up=True):
+        self.pin = pin
+        self.gpio = gpio
+        self.on_press = on_press
+        self.on_double_press = on_double_press
+        self.on_long_press = on_long_press
+        self.debounce = debounce or float(os.getenv("BUTTON_DEBOUNCE_MS", "30")) / 1000
+        self.double_press = double_press or float(os.getenv("BUTTON_DOUBLE_PRESS", "0.4"))
+        self.long_press = long_press or float(os.getenv("BUTTON_LONG_PRESS", "1.5"))
+        # With a pull-up the pin reads LOW while the button is down
+        self.active_level = gpio.LOW if pull_up else gpio.HIGH
+
+        self.pressed = False
+        self.presses = 0
+        self._last_press = None
+        self._long_due = None
+        # A press waiting to be told apart from a long or double press, and
+        # when the double press window closes on it
+        self._pending = False
+        self._press_due = None
+        self._edges = queue.Queue()
+
+        gpio.setmode(gpio.BCM)
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP if pull_up else gpio.PUD_DOWN)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # Called on the GPIO library's own thread: only note the time
+        gpio.add_event_detect(pin, gpio.BOTH, callback=lambda channel: self._edges.put(time.monotonic()))
+
+    def _run(self):
+        while True:
+            due = [t for t in (self._long_due, self._press_due) if t is not None]
+            timeout = max(0.0, min(due) - time.monotonic()) if due else None
+            try:
+                edge = self._edges.get(timeout=timeout)
+            except queue.Empty:
+                self._timer_due(time.monotonic())
+                continue
+            if edge is _STOP:
+                return
+            self._level_changed(edge)
+
+            # Ignore the bounces, then make sure the level we acted on is where it settled
+            settled = edge + self.debounce
+            while time.monotonic() < settled:
+                try:
+                    if self._edges.get(timeout=max(0.0, settled - time.monotonic())) is _STOP:
+                        return
+                except queue.Empty:
+                    break
+            self._level_changed(settled)
+
+    def _level_changed(self, now):
+        pressed = self.gpio.input(self.pin) == self.active_level
+        if pressed == self.pressed:
+            return
+        self.pressed = pressed
+        if not pressed:
+            self._long_due = None
+            if self._pending and (self._press_due is None or now >= self._press_due):
+                self._press()
+            return
+        if self._last_press is not None and now - self._last_press <= self.double_press and self.on_double_press:
+            # Neither press of a double press is reported as a press
+            self._last_press = None
+            self._pending = False
+            self._press_due = None
+            self._dispatch(self.on_double_press)
+            return
+        self._last_press = now
+        self.presses += 1
+        if not (self.on_long_press or self.on_double_press):
+            self._dispatch(self.on_press)
+            return
+        if self.on_long_press:
+            self._long_due = now + self.long_press
+        self._pending = True
+        self._press_due = now + self.double_press if self.on_double_press else None
+
+    def _timer_due(self, now):
+        if self._long_due is not None and now >= self._long_due:
+            self._long_due = None
+            if self.pressed:
+                # Held: a long press and nothing else
+                self._pending = False
+                self._press_due = None
+                self._dispatch(self.on_long_press)
+        if self._press_due is not None and now >= self._press_due:
+            self._press_due = None
+            # Still held, it is reported on release unless it becomes a long press
+            if self._pending and not self.pressed:
+                self._press()
+
+    def _press(self):
+        self._pending = False
+        self._press_due = None
+        self._dispatch(self.on_press)
+
+    def _dispatch(self, handler):
+        if handler is None:
+            return
+
+        def call():
+            try:
+                handler()
+            except Exception as e:
+                print(f"Error in button handler: {e}")
+
+        threading.Thread(target=call, daemon=True).start()
+
+    def close(self):
+        self.gpio.remove_event_detect(self.pin)
+        self._edges.put(_STOP)
+
+
+class FakeGPIO:
+    """In-memory stand-in for RPi.GPIO; ``press``/``release`` drive the pins"""
+
+    BCM = "BCM"
+    BOARD = "BOARD"
+    IN = "IN"
+    OUT = "OUT"
+    PUD_UP = "PUD_UP"
+    PUD_DOWN = "PUD_DOWN"
+    PUD_OFF = "PUD_OFF"
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, keyboard=False):
+        self.mode = None
+        self.levels = {}
+        self.pulls = {}
+        self.callbacks = {}
+        self._lock = threading.Lock()
+        if keyboard:
+            threading.Thread(target=self._keyboard, daemon=True).start()
+
+    # The RPi.GPIO interface
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.pulls[pin] = pull_up_down
+        # An open switch reads the level it is pulled to
+        self.levels[pin] = initial if initial is not None else self._idle(pin)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def output(self, pin, level):
+        self._set(pin, level)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        if pin in self.callbacks:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self, pin=None):
+        for channel in [pin] if pin is not None else list(self.levels):
+            self.callbacks.pop(channel, None)
+            self.levels.pop(channel, None)
+
+    # Driving the pins
+
+    def _idle(self, pin):
+        return self.LOW if self.pulls.get(pin) == self.PUD_DOWN else self.HIGH
+
+    def press(self, pin, bounces=0):
+        """Close the switch, with ``bounces`` extra contact bounces"""
+        active = self.HIGH if self._idle(pin) == self.LOW else self.LOW
+        for _ in range(bounces):
+            self._set(pin, active)
+            self._set(pin, self._idle(pin))
+        self._set(pin, active)
+
+    def release(self, pin, bounces=0):
+        for _ in range(bounces):
+            self._set(pin, self._idle(pin))
+            self._set(pin, self.HIGH if self._idle(pin) == self.LOW else self.LOW)
+        self._set(pin, self._idle(pin))
+
+    def click(self, pin, hold=0.1, bounces=0):
+        self.press(pin, bounces)
+        time.sleep(hold)
+        self.release(pin, bounces)
+
+    def _set(self, pin, level):
+        with self._lock:
+            previous = self.levels.get(pin)
+            self.levels[pin] = level
+            edge, callback = self.callbacks.get(pin, (None, None))
+        if callback is None or level == previous:
+            return
+        rising = level == self.HIGH
+        if edge == self.BOTH or edge == (self.RISING if rising else self.FALLING):
+            callback(pin)
+
+    def _keyboard(self):
+        print("Fake GPIO: Enter = press, 'd' + Enter = double press, 'l' + Enter = long press")
+        for line in sys.stdin:
+            command = line.strip().lower()
+            for pin in list(self.callbacks):
+                if command == "l":
+                    self.click(pin, hold=3.0)
+                elif command == "d":
+                    self.click(pin)
+                    time.sleep(0.1)
+                    self.click(pin)
+                else:
+                    self.click(pin)
+
+
+def _check():
+    """Drive a Button through FakeGPIO and check each action gives exactly one gesture"""
+    gpio = FakeGPIO()
+    events = []
+    button = Button(17, gpio, on_press=lambda: events.append("press"),
+                    on_double_press=lambda: events.append("double press"),
+                    on_long_press=lambda: events.append("long press"),
+                    debounce=0.03, double_press=0.3, long_press=0.5)
+    cases = [
+        ("click", lambda: gpio.click(17, hold=0.05, bounces=3), ["press"]),
+        ("double click", lambda: (gpio.click(17, hold=0.05), time.sleep(0.1), gpio.click(17, hold=0.05)),
+         ["double press"]),
+        ("hold", lambda: (gpio.press(17), time.sleep(1.0), gpio.release(17)), ["long press"]),
+    ]
+    failed = False
+    for name, act, expected in cases:
+        events.clear()
+        act()
+        # Let the double press window run out
+        time.sleep(0.6)
+        ok = events == expected
+        failed = failed or not ok
+        print(f"{name:<13} {', '.join(events) or 'nothing':<28} {'ok' if ok else f'expected {expected}'}")
+    button.close()
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if _check() else 1)
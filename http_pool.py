@@ -0,0 +1,125 @@
+"""Persistent keep-alive HTTP connections for the HTTP backends.
+
+Each backend owns one ``HTTPPool``: a requests Session whose connections to
+the backend's host are kept open and reused from turn to turn, so a turn
+does not pay a new TCP connection (and for https a TLS handshake) every time.
+The pool connects ahead of the first turn, and when it has been idle for
+HTTP_KEEPALIVE_INTERVAL seconds it sends a HEAD request so the connection is
+not closed by the server just before the next turn needs it.
+
+Connections are only reused when a response is read to the end (or closed
+after it was), which every backend does.
+"""
+import os
+import time
+import threading
+
+
+def keepalive_loop(preconnect, last_used, interval, stop):
+    """Call ``preconnect()`` now, then again whenever the connection has been
+    idle for ``interval`` seconds (by ``last_used()``), until ``stop`` is set"""
+    preconnect()
+    if interval <= 0:
+        return
+    pinged = time.monotonic()
+    while not stop.wait(interval):
+        if time.monotonic() - max(last_used(), pinged) >= interval:
+            preconnect()
+            pinged = time.monotonic()
+
+
+class HTTPPool:
+    def __init__(self, base_url, pool_size=None, connect_timeout=None, read_timeout=None,
+                 keepalive_interval=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url
+        self.pool_size = pool_size or int(os.getenv("HTTP_POOL_SIZE", "4"))
+        self.connect_timeout = connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+        self.read_timeout = read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+        if keepalive_interval is None:
+            keepalive_interval = float(os.getenv("HTTP_KEEPALIVE_INTERVAL", "30"))
+        self.keepalive_interval = keepalive_interval
+
+        self.session = requests.Session()
+        # Enough connections for a hedged request next to a probe and a warmup
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+        self.requests = 0
+        self.pings = 0
+        self.last_used = time.monotonic()
+        self._reachable = True
+        self._stop = threading.Event()
+
+    def start(self):
+        """Connect now and keep the connection warm while idle, all in the background"""
+        threading.Thread(target=self._keepalive_loop, daemon=True).start()
+        return self
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        self.requests += 1
+        self.last_used = time.monotonic()
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def preconnect(self):
+        """Open a connection to the host ahead of the first real request"""
+        try:
+            # Any status will do, the point is the open connection
+            self.pings += 1
+            self.session.head(self.base_url, timeout=(self.connect_timeout, self.connect_timeout)).close()
+            self._reachable = True
+        except Exception as e:
+            # Only report the change, not every idle ping
+            if self._reachable:
+                print(f"Could not pre-connect to {self.base_url}: {e}")
+            self._reachable = False
+
+    def _keepalive_loop(self):
+        keepalive_loop(self.preconnect, lambda: self.last_used, self.keepalive_interval, self._stop)
+
+    def connections(self):
+        """Connections opened so far, including pre-connects"""
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def stats(self):
+        connections = self.connections()
+        sent = self.requests + self.pings
+        return {
+            "requests": self.requests,
+            "pings": self.pings,
+            "connections": connections,
+            # Share of requests and pings that went out on an already open connection
+            "reuse_rate": round(1 - connections / sent, 3) if sent else None,
+        }
+
+    def close(self):
+        self._stop.set()
+        self.session.close()
+
+
+def report(backends):
+    """Print the connection reuse of every loaded backend that pools HTTP connections"""
+    for backend in backends:
+        # A Deferred backend still loading is skipped rather than waited for
+        if hasattr(type(backend), "wait") and not backend.wait(0):
+            continue
+        try:
+            http = backend.stats().get("http")
+        except Exception:
+            # No stats(), or the backend failed to load
+            continue
+        if http:
+            name = getattr(backend, "name", type(backend).__name__)
+            print(f"{name} HTTP: {http['requests']} requests over {http['connections']} connections "
+                  f"(reuse rate {http['reuse_rate']})")
@@ -0,0 +1,320 @@
+"""Wake-word gate for the always-listening mode.
+
+``KeywordGatedSTT`` wraps a speech recognizer and listens to the shared
+microphone capture (capture.py) itself. Speech recognition is only asked to transcribe what is said after
+the wake word, so TV noise and chatter in the room cost neither network
+calls nor recognizer CPU. The gate stays cheap because it works in stages:
+
+- every 20 ms frame goes through the energy/zero-crossing VAD (vad.py);
+- only voiced segments of up to ``max_keyword`` seconds get log-mel
+  features, computed for all their frames at once with NumPy;
+- those are matched against a few recordings of the wake word by dynamic
+  time warping, one vectorized row per template frame. The match is
+  anchored at the start of the segment and open at its end, so "Immy, tell
+  me a story" in one breath is split after "Immy".
+
+The templates are WAV files in KWS_TEMPLATE_DIR, recorded with
+
+    python kws.py enroll [--count 3]
+
+KWS_SENSITIVITY (0 to 1) trades missed wake words for false ones.
+``stats()`` reports the duty cycle (the share of audio that needed
+features and matching) and the gate's CPU time per second of audio; they
+are printed every KWS_REPORT_INTERVAL seconds.
+"""
+import os
+import time
+import wave
+import glob
+import argparse
+
+import numpy as np
+
+from capture import AudioCapture
+from vad import EnergyVAD, Endpointer
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "immy", "kws")
+
+SAMPLE_RATE = 16000
+
+# Features: 25 ms windows every 10 ms, 20 log-mel bands
+WINDOW = 400
+HOP = 160
+N_FFT = 512
+N_MELS = 20
+
+
+def mel_filterbank(n_mels=N_MELS, n_fft=N_FFT, sample_rate=SAMPLE_RATE, low=60.0, high=7600.0):
+    """Triangular mel filters as an (n_mels, n_fft // 2 + 1) matrix"""
+    mel = lambda hz: 2595 * np.log10(1 + hz / 700)
+    hz = lambda m: 700 * (10 ** (m / 2595) - 1)
+    edges = hz(np.linspace(mel(low), mel(high), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling)).astype(np.float32)
+
+
+_MEL = mel_filterbank()
+_WINDOW = np.hamming(WINDOW).astype(np.float32)
+
+
+def log_mel(samples):
+    """Mean-normalized log-mel features, one row per 10 ms frame"""
+    if len(samples) < WINDOW:
+        return np.zeros((0, N_MELS), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, WINDOW)[::HOP] * _WINDOW
+    power = np.abs(np.fft.rfft(frames, n=N_FFT)) ** 2
+    features = np.log(power @ _MEL.T + 1e-8)
+    # Removing the mean cancels the microphone and room coloring
+    features -= features.mean(axis=0)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return (features / np.maximum(norms, 1e-8)).astype(np.float32)
+
+
+def match(template, features):
+    """Lowest average DTW cost of the template against a prefix of features, and where that prefix ends
+
+    The template must start where features start; each of its frames
+    advances through features by 0, 1 or 2 frames, so every row of the
+    cost matrix depends only on the previous one and is computed at once.
+    """
+    if len(features) == 0:
+        return float("inf"), 0
+    # Rows are unit vectors, so the cosine distance is one minus a dot product
+    cost = 1.0 - template @ features.T
+    total = np.full(len(features), np.inf, dtype=np.float32)
+    total[0] = cost[0, 0]
+    for row in cost[1:]:
+        best = total.copy()
+        best[1:] = np.minimum(best[1:], total[:-1])
+        best[2:] = np.minimum(best[2:], total[:-2])
+        total = row + best
+    end = int(np.argmin(total))
+    return float(total[end]) / len(template), end + 1
+
+
+class KeywordSpotter:
+    """Dynamic time warping against recordings of the wake word"""
+
+    def __init__(self, templates, sensitivity=None):
+        self.templates = [log_mel(samples) for samples in templates]
+        self.sensitivity = sensitivity if sensitivity is not None else float(os.getenv("KWS_SENSITIVITY", "0.5"))
+        # Cosine distances: about 0.2 for the same word, 0.5 and up for others
+        self.threshold = 0.15 + 0.3 * self.sensitivity
+
+    @classmethod
+    def load(cls, template_dir=None, sensitivity=None):
+        """Spotter for the WAV templates in template_dir, or None if there are none"""
+        template_dir = os.path.expanduser(template_dir or os.getenv("KWS_TEMPLATE_DIR", DEFAULT_TEMPLATE_DIR))
+        paths = sorted(glob.glob(os.path.join(template_dir, "*.wav")))
+        if not paths:
+            return None
+        return cls([read_wav(path) for path in paths], sensitivity)
+
+    @property
+    def max_frames(self):
+        return max(len(template) for template in self.templates)
+
+    def detect(self, samples):
+        """Samples into the segment where the wake word ends, or None"""
+        # Never consider stretching the word to more than twice its length
+        features = log_mel(samples[:(2 * self.max_frames - 1) * HOP + WINDOW])
+        best_cost, best_end = float("inf"), 0
+        for template in self.templates:
+            cost, end = match(template, features[:2 * len(template)])
+            if cost < best_cost:
+                best_cost, best_end = cost, end
+        if best_cost > self.threshold:
+            return None
+        return min(len(samples), (best_end - 1) * HOP + WINDOW)
+
+
+class KeywordGatedSTT:
+    """Speech recognition that only runs on what follows the wake word
+
+    The wrapped backend must have ``transcribe(samples, sample_rate)``.
+    """
+
+    def __init__(self, stt, spotter, vad=None, max_keyword=2.0, silence_ms=300, on_wake=None,
+                 report_interval=None, capture=None):
+        self.stt = stt
+        self.spotter = spotter
+        self.vad = vad or EnergyVAD(sample_rate=SAMPLE_RATE)
+        self.max_keyword_samples = int(max_keyword * SAMPLE_RATE)
+        self.silence_frames = int(silence_ms / 1000 * SAMPLE_RATE / self.vad.frame_length)
+        # Called when the wake word is heard, e.g. to give a listening cue
+        self.on_wake = on_wake
+        self.capture = capture or AudioCapture.shared()
+        self.capture_seconds = None
+        # Seconds from the recognize() call to the start of the wake word's
+        # audio, so a turn's latency excludes the idle wait before it
+        self.speech_started = None
+        # True when no wake word was heard, which is not a failed turn
+        self.no_speech = False
+        self._keyword_seconds = 0.0
+
+        # Duty-cycle and CPU accounting
+        self.audio_seconds = 0.0
+        self.matched_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.detections = 0
+        self.rejections = 0
+        self.report_interval = report_interval or float(os.getenv("KWS_REPORT_INTERVAL", "600"))
+        self._reported = time.monotonic()
+
+    def recognize(self, on_partial=None):
+        """Wait for the wake word, then recognize what follows it"""
+        started = time.monotonic()
+        self.speech_started = None
+        self.no_speech = False
+        blocks = self.capture.listen()
+        try:
+            rest = self._wait_for_keyword(blocks)
+            self.no_speech = rest is None
+            if rest is not None:
+                # The segment with the wake word, pre-roll included, ended just now
+                self.speech_started = max(0.0, time.monotonic() - started - self._keyword_seconds)
+            command = self._record_command(blocks, rest) if rest is not None else None
+        except Exception as e:
+            print(f"Error recording: {str(e)}")
+            return None
+        finally:
+            blocks.close()
+        self.capture_seconds = time.monotonic() - started
+        if command is None:
+            return None
+        return self.stt.transcribe(command, SAMPLE_RATE)
+
+    def _wait_for_keyword(self, blocks):
+        """Listen until the wake word; returns the audio captured after it"""
+        frame_length = self.vad.frame_length
+        pre_roll = np.zeros(0, dtype=np.float32)
+        pending = np.zeros(0, dtype=np.float32)
+        segment = []
+        segment_samples = 0
+        # Non-speech frames since the last speech frame
+        silence = self.silence_frames
+        # After a segment too long to be the wake word, wait for a pause
+        skipping = False
+        for block in blocks:
+            cpu = time.thread_time()
+            self.audio_seconds += len(block) / SAMPLE_RATE
+
+            samples = np.concatenate((pending, block))
+            usable = len(samples) - len(samples) % frame_length
+            pending = samples[usable:]
+            samples = samples[:usable]
+            speech = self.vad.speech_frames(samples)
+            silence = int(np.argmax(speech[::-1])) if speech.any() else silence + len(speech)
+
+            result = None
+            if skipping:
+                skipping = silence < self.silence_frames
+            elif segment or speech.any():
+                if not segment:
+                    # Keep a little audio from before the onset
+                    segment, segment_samples = [pre_roll], len(pre_roll)
+                segment.append(samples)
+                segment_samples += len(samples)
+                if silence >= self.silence_frames or segment_samples >= self.max_keyword_samples:
+                    result = self._check(np.concatenate(segment))
+                    skipping = result is None and silence < self.silence_frames
+                    segment, segment_samples = [], 0
+            pre_roll = np.concatenate((pre_roll, samples))[-4 * frame_length:]
+            self.cpu_seconds += time.thread_time() - cpu
+            if result is not None:
+                return result
+            if time.monotonic() - self._reported >= self.report_interval:
+                self._report()
+        return None
+
+    def _check(self, segment):
+        self._keyword_seconds = len(segment) / SAMPLE_RATE
+        self.matched_seconds += self._keyword_seconds
+        end = self.spotter.detect(segment)
+        if end is None:
+            self.rejections += 1
+            return None
+        self.detections += 1
+        print("Wake word heard")
+        if self.on_wake:
+            self.on_wake()
+        return segment[end:]
+
+    def _record_command(self, blocks, rest):
+        """The utterance after the wake word, or None if nothing followed it"""
+        # Sharing the VAD keeps the noise floor it has learned
+        endpointer = Endpointer(vad=self.vad, sample_rate=SAMPLE_RATE)
+        if not endpointer.process(rest):
+            for block in blocks:
+                if endpointer.process(block):
+                    break
+        return endpointer.audio()
+
+    def _report(self):
+        self._reported = time.monotonic()
+        stats = self.stats()
+        print(f"Wake word gate: {stats['detections']} detections, {stats['rejections']} rejections, "
+              f"duty cycle {stats['duty_cycle']:.1%}, CPU {stats['cpu_percent']:.2f}% "
+              f"over {stats['audio_seconds'] / 3600:.1f} h of audio")
+
+    def stats(self):
+        audio = max(self.audio_seconds, 1e-9)
+        return {
+            "audio_seconds": round(self.audio_seconds, 1),
+            "duty_cycle": round(self.matched_seconds / audio, 4),
+            "cpu_percent": round(100 * self.cpu_seconds / audio, 2),
+            "detections": self.detections,
+            "rejections": self.rejections,
+        }
+
+    def close(self):
+        if hasattr(self.stt, "close"):
+            self.stt.close()
+
+
+def read_wav(path):
+    """16-bit mono WAV as float32 samples"""
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"{path}: wake word templates must be 16 kHz 16-bit mono")
+        frames = wav.readframes(wav.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768
+
+
+def enroll(template_dir, count):
+    """Record the wake word ``count`` times into template_dir"""
+    os.makedirs(template_dir, exist_ok=True)
+    capture = AudioCapture(sample_rate=SAMPLE_RATE).start()
+    existing = len(glob.glob(os.path.join(template_dir, "*.wav")))
+    try:
+        for index in range(count):
+            input(f"Press Enter, then say the wake word ({index + 1}/{count})")
+            endpointer = Endpointer(sample_rate=SAMPLE_RATE, pre_roll_ms=100, hangover_ms=300, max_duration=2.0)
+            for block in capture.listen():
+                if endpointer.process(block):
+                    break
+            samples = endpointer.audio()
+            if samples is None:
+                print("Didn't hear anything, skipping")
+                continue
+            path = os.path.join(template_dir, f"wake_{existing + index:02d}.wav")
+            with wave.open(path, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(SAMPLE_RATE)
+                wav.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+            print(f"Saved {path} ({len(samples) / SAMPLE_RATE:.1f}s)")
+    finally:
+        capture.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record wake word templates")
+    parser.add_argument("command", choices=["enroll"])
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--dir", default=os.getenv("KWS_TEMPLATE_DIR", DEFAULT_TEMPLATE_DIR))
+    args = parser.parse_args()
+    enroll(os.path.expanduser(args.dir), args.count)
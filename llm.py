@@ -0,0 +1,400 @@
+"""LLM backends for the Immy pipeline.
+
+Every backend exposes ``stream(user_input, history=None) -> Iterator[str]``
+which yields the reply as text pieces as soon as they are available. Backends
+that cannot stream yield the whole reply once. ``history`` holds the earlier
+messages of the conversation (see conversation.py). Errors are raised to the
+caller.
+
+``cancel`` is an optional CancelToken (see cancellation.py); when it is set
+the backend aborts its request, so a reply that has been interrupted stops
+using the network at once, and the stream ends without raising.
+"""
+import os
+import json
+import time
+import socket
+import threading
+from collections import deque
+from typing import Iterator
+
+SYSTEM_PROMPT = (
+    "You are Immy, a magical AI-powered teddy bear who loves to chat with children. "
+    "You are kind, funny, and full of wonder, always ready to tell stories, answer questions, and offer friendly advice. "
+    "When speaking, you are playful, patient, and use simple, child-friendly language. You encourage curiosity, learning, and imagination. "
+    "Keep your responses short and cute. "
+    "Don't use emojis in your responses."
+)
+
+
+class StreamWatchdog:
+    """Closes a streaming HTTP response when the next token is overdue
+
+    The first token gets ``first_timeout`` seconds (it may include a model
+    load), every later one ``token_timeout`` seconds from the previous one.
+    """
+
+    def __init__(self, response, first_timeout, token_timeout):
+        self.response = response
+        self.token_timeout = token_timeout
+        self.deadline = time.monotonic() + first_timeout
+        self.expired = False
+        self._done = threading.Event()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def feed(self):
+        """Record that a token arrived"""
+        self.deadline = time.monotonic() + self.token_timeout
+
+    def stop(self):
+        self._done.set()
+
+    def _watch(self):
+        # feed() can pull the deadline in from first_timeout to token_timeout,
+        # so never sleep longer than token_timeout before re-checking
+        while not self._done.wait(max(0.0, min(self.deadline - time.monotonic(), self.token_timeout))):
+            if time.monotonic() >= self.deadline:
+                self.expired = True
+                abort_response(self.response)
+                return
+
+
+def abort_response(response):
+    """Abort a streaming response, waking up a reader blocked on the socket"""
+    # close() alone does not interrupt a recv() in progress on another thread
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+class GroqLLM:
+    """Token streaming chat completions from Groq"""
+
+    name = "Groq API"
+
+    def __init__(self, api_key=None, model="llama-3.1-8b-instant", system_prompt=SYSTEM_PROMPT, base_url=None):
+        from groq import Groq
+
+        # base_url points the client at a stand-in server, e.g. for benchmarks
+        self.client = Groq(api_key=api_key or os.getenv("GROQ_API_KEY"), base_url=base_url)
+        self.model = model
+        self.system_prompt = system_prompt
+
+    def stream(self, user_input: str, history=None, cancel=None) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                *(history or []),
+                {"role": "user", "content": user_input}
+            ],
+            stream=True
+        )
+
+        unregister = cancel.on_cancel(stream.close) if cancel else lambda: None
+        try:
+            for chunk in stream:
+                content = chunk.choices[0].delta.content
+                if content is not None:
+                    yield content
+        except Exception:
+            if cancel and cancel.is_set():
+                return
+            raise
+        finally:
+            unregister()
+            stream.close()
+
+    def probe(self):
+        """Cheap reachability check for the router"""
+        self.client.models.list()
+
+
+class LLMinaBoxLLM:
+    """Question answering through the LLM in a Box HTTP API
+
+    The reply is consumed as it arrives when the server streams it as
+    NDJSON, server-sent events or plain chunked text; a plain JSON body is
+    read whole. Streamed JSON pieces may carry either the new text or the
+    whole reply so far, both are handled.
+    """
+
+    name = "LLMinaBox"
+
+    # Fields a streamed JSON piece may carry its text in
+    TEXT_FIELDS = ("text", "token", "response", "delta", "content")
+
+    def __init__(self, api_url=None):
+        from http_pool import HTTPPool
+
+        self.api_url = api_url or os.getenv("LLMINABOX_API_URL")
+        self.http = HTTPPool(self.api_url).start()
+
+    def stream(self, user_input: str, history=None, cancel=None) -> Iterator[str]:
+        # The API answers single questions, so history is not sent
+        payload = {"question": user_input}
+        response = self.http.post(
+            self.api_url,
+            json=payload,
+            stream=True,
+            headers={"Accept": "application/x-ndjson, text/event-stream, application/json"},
+        )
+        unregister = cancel.on_cancel(lambda: abort_response(response)) if cancel else lambda: None
+        try:
+            response.raise_for_status()  # Raise an exception for bad status codes
+
+            print(f"Response status code: {response.status_code}")
+
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type in ("application/x-ndjson", "application/jsonl", "application/json-seq"):
+                yield from self._pieces(self._json_lines(response))
+            elif content_type == "text/event-stream":
+                yield from self._pieces(self._events(response))
+            elif content_type.startswith("text/"):
+                response.encoding = response.encoding or "utf-8"
+                for text in response.iter_content(chunk_size=None, decode_unicode=True):
+                    if text:
+                        yield text
+            else:
+                # Extract the text from the JSON response
+                json_response = response.json()
+                yield json_response.get('text', 'No text field in JSON')
+        except Exception:
+            if cancel and cancel.is_set():
+                return
+            raise
+        finally:
+            unregister()
+            response.close()
+
+    @staticmethod
+    def _json_lines(response):
+        for line in response.iter_lines():
+            line = line.strip().lstrip(b"\x1e")  # json-seq record separator
+            if line:
+                yield json.loads(line)
+
+    @staticmethod
+    def _events(response):
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            yield json.loads(data)
+
+    def _pieces(self, chunks):
+        """Text added by each streamed JSON piece"""
+        received = ""
+        for chunk in chunks:
+            if not isinstance(chunk, dict):
+                continue
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"])
+            text = next((chunk[field] for field in self.TEXT_FIELDS if isinstance(chunk.get(field), str)), "")
+            # Cumulative servers resend the reply so far: only pass on what is new
+            if received and text.startswith(received):
+                text = text[len(received):]
+            if text:
+                received += text
+                yield text
+            if chunk.get("done"):
+                return
+
+    def stats(self):
+        return {"http": self.http.stats()}
+
+    def close(self):
+        self.http.close()
+
+
+def parse_duration(value):
+    """Seconds in an Ollama keep_alive value ("30m", "1h", "300", "-1"); negative means forever"""
+    value = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    seconds = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+class OllamaLLM:
+    """Offline chat through a local Ollama server, streamed as NDJSON
+
+    ``warmup()`` loads the model and prefills the system prompt before the
+    first turn, and ``keep_resident()`` loads it again if Ollama drops it
+    before its keep-alive has run out. First-token latency is tracked
+    separately for turns that found the model loaded (warm) and turns that
+    had to load it (cold).
+    """
+
+    name = "Ollama API"
+
+    def __init__(self, api_url="http://localhost:11434/api/chat", model="qwen2.5:0.5b",
+                 system_prompt=SYSTEM_PROMPT, connect_timeout=3.05, first_token_timeout=15,
+                 token_timeout=5, keep_alive=None):
+        self.api_url = api_url
+        self.model = model
+        self.system_prompt = system_prompt
+        # Keep the model, and with it the cached prompt prefix, loaded between turns
+        self.keep_alive = keep_alive or os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.token_timeout = token_timeout
+        self.base_url = api_url.split("/api/")[0]
+
+        from http_pool import HTTPPool
+
+        self.http = HTTPPool(self.base_url, connect_timeout=connect_timeout).start()
+
+        self.first_token_latency = {"warm": deque(maxlen=50), "cold": deque(maxlen=50)}
+        self.last_used = None
+        self._stop_residency = threading.Event()
+
+    def stream(self, user_input: str, history=None, cancel=None) -> Iterator[str]:
+        import requests
+
+        # System prompt and history come first and unchanged, so Ollama reuses
+        # their cached prefix and only prefills the new utterance
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            *(history or []),
+            {"role": "user", "content": user_input}
+        ]
+
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+
+        # Headers only arrive with the first chunk, so the read timeout
+        # bounds the wait for the first token; the watchdog takes over after
+        started = time.monotonic()
+        first_token = None
+        self.last_used = started
+        try:
+            response = self.http.post(
+                self.api_url,
+                json=payload,
+                stream=True,
+                timeout=(self.connect_timeout, self.first_token_timeout),
+            )
+        except requests.exceptions.Timeout as e:
+            raise TimeoutError(f"no first token from Ollama within {self.first_token_timeout}s") from e
+
+        watchdog = StreamWatchdog(response, self.first_token_timeout, self.token_timeout)
+        unregister = cancel.on_cancel(lambda: abort_response(response)) if cancel else lambda: None
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                watchdog.feed()
+                content = chunk.get('message', {}).get('content', '')
+                if content:
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    yield content
+                if chunk.get('done'):
+                    # Not breaking: reading to the end lets the connection be reused
+                    self._record_latency(first_token, chunk.get('load_duration', 0) / 1e9)
+        except Exception as e:
+            if cancel and cancel.is_set():
+                return
+            if watchdog.expired:
+                raise TimeoutError(f"no token from Ollama for {self.token_timeout}s") from e
+            raise
+        else:
+            if watchdog.expired:
+                raise TimeoutError(f"no token from Ollama for {self.token_timeout}s")
+        finally:
+            unregister()
+            watchdog.stop()
+            response.close()
+            self.last_used = time.monotonic()
+
+    def _record_latency(self, first_token, load_seconds):
+        if first_token is None:
+            return
+        # Ollama reports a few milliseconds of load time even for a resident model
+        cold = load_seconds > 0.5
+        self.first_token_latency["cold" if cold else "warm"].append(first_token)
+        if cold:
+            print(f"Ollama had to load {self.model} ({load_seconds:.1f}s), first token after {first_token:.1f}s")
+
+    def warmup(self):
+        """Load the model and prefill the system prompt; returns self, never raises"""
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": "Hi"}
+            ],
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": 1},
+        }
+        started = time.monotonic()
+        try:
+            response = self.http.post(self.api_url, json=payload, timeout=(self.connect_timeout, 120))
+            response.raise_for_status()
+            print(f"Ollama model {self.model} warmed up in {time.monotonic() - started:.1f}s")
+            self.last_used = time.monotonic()
+        except Exception as e:
+            print(f"Error warming up Ollama: {e}")
+        return self
+
+    def is_loaded(self):
+        """True if Ollama currently holds the model in memory"""
+        response = self.http.get(f"{self.base_url}/api/ps", timeout=self.connect_timeout)
+        response.raise_for_status()
+        names = {model.get("name") for model in response.json().get("models", [])}
+        return self.model in names or f"{self.model}:latest" in names
+
+    def keep_resident(self, interval=None):
+        """Check on the model in the background and re-warm it after an early unload"""
+        interval = interval or float(os.getenv("OLLAMA_RESIDENCY_CHECK", "30"))
+        self._stop_residency.clear()
+        threading.Thread(target=self._residency_loop, args=(interval,), daemon=True).start()
+        return self
+
+    def _residency_loop(self, interval):
+        keep_alive = parse_duration(self.keep_alive)
+        while not self._stop_residency.wait(interval):
+            # Past its keep-alive the model is meant to go; that is not an unload to undo
+            if self.last_used is None or time.monotonic() - self.last_used >= keep_alive:
+                continue
+            try:
+                loaded = self.is_loaded()
+            except Exception:
+                continue  # Ollama is down; the next turn will report it
+            if not loaded:
+                print(f"Ollama unloaded {self.model}, warming it up again")
+                self.warmup()
+
+    def stats(self):
+        stats = {}
+        for kind, latencies in self.first_token_latency.items():
+            latencies = sorted(latencies)
+            stats[f"{kind}_turns"] = len(latencies)
+            stats[f"{kind}_first_token_p50"] = round(latencies[len(latencies) // 2], 3) if latencies else None
+        stats["http"] = self.http.stats()
+        return stats
+
+    def probe(self):
+        """Cheap reachability check for the router: the server lists its models"""
+        response = self.http.get(f"{self.base_url}/api/tags", timeout=self.connect_timeout)
+        response.raise_for_status()
+
+    def close(self):
+        self._stop_residency.set()
+        self.http.close()
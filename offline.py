@@ -1,176 +1,61 @@
+from startup import StartupTimer, Deferred, preload
+timer = StartupTimer()
+
 import os
-import time
-import requests
 import tkinter as tk
 from tkinter import messagebox
-import json
-from pydub import AudioSegment
-from pydub.playback import play
-import pyttsx3
-import pyaudio
-import numpy as np
-from faster_whisper import WhisperModel
 import threading
-from queue import Queue
-import os
+
+from pipeline import Pipeline
+from stt import WhisperSTT
+from llm import OllamaLLM
+from tts import Pyttsx3TTS
+from tts_cache import CachedTTS
+from conversation_log import ConversationLog
+from conversation import ConversationContext
+from tracing import TurnTracer
+from http_pool import report as report_connections
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
+timer.mark("imports")
+
 class SpeechBot:
     def __init__(self):
         self.OLLAMA_API_URL = "http://localhost:11434/api/chat"
-        
-        # Initialize text-to-speech engine
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', 150)
-        self.engine.setProperty('volume', 0.9)
-        
-        # Initialize Faster Whisper with optimized settings
-        print("Loading Whisper model...")
-        self.model = WhisperModel(
-            "base",
-            device="cpu" if self.is_cuda_available() else "cpu",
-            compute_type="int8" if self.is_cuda_available() else "int8",
-            cpu_threads=8,  # Adjust based on your CPU
-            num_workers=4   # Parallel processing workers
-        )
-        print("Whisper model loaded!")
-        
-        # Audio recording parameters
-        self.CHUNK = 2048  # Larger chunk size for better performance
-        self.FORMAT = pyaudio.paFloat32
-        self.CHANNELS = 1
-        self.RATE = 16000
-        
-        # Initialize PyAudio
-        self.audio = pyaudio.PyAudio()
-        
-        # Setup voice
-        voices = self.engine.getProperty('voices')
-        for voice in voices:
-            if "female" in voice.name.lower():
-                self.engine.setProperty('voice', voice.id)
-                break
-        
-        # Create queues for async processing
-        self.audio_queue = Queue()
-        self.response_queue = Queue()
-
-    def is_cuda_available(self):
-        """Check if CUDA is available"""
-        try:
-            import torch
-            return torch.cuda.is_available()
-        except ImportError:
-            return False
-
-    def text_to_speech(self, text: str) -> None:
-        """Optimized text-to-speech conversion"""
-        if not text:
-            return
-            
-        temp_file = "temp_speech.wav"
-        try:
-            self.engine.save_to_file(text, temp_file)
-            self.engine.runAndWait()
-            audio = AudioSegment.from_wav(temp_file)
-            play(audio)
-        except Exception as e:
-            print(f"Error in text-to-speech: {str(e)}")
-        finally:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
 
-    def record_audio(self, duration=3):
-        """Optimized audio recording"""
-        frames = []
-        stream = self.audio.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
-            input=True,
-            frames_per_buffer=self.CHUNK
+        # Whisper for recognition, Ollama for replies and pyttsx3 for speech, all offline.
+        # The Whisper model and the speech engine load in the background so the
+        # window comes up straight away.
+        self.stt = Deferred("Whisper model", lambda: WhisperSTT("base"), timer)
+        self.tts = Deferred("speech engine", lambda: Pyttsx3TTS(rate=150, volume=0.9), timer)
+        # Load the model before the first question and keep it loaded
+        self.llm = Deferred(
+            "Ollama model",
+            lambda: OllamaLLM(api_url=self.OLLAMA_API_URL, model="qwen2.5:0.5b").warmup().keep_resident(),
+            timer,
         )
-        
-        print("Recording...")
-        
-        # Calculate total chunks needed
-        total_chunks = int((self.RATE * duration) / self.CHUNK)
-        
-        # Record audio
-        for _ in range(total_chunks):
-            try:
-                data = stream.read(self.CHUNK, exception_on_overflow=False)
-                frames.append(np.frombuffer(data, dtype=np.float32))
-            except Exception as e:
-                print(f"Error recording: {str(e)}")
-        
-        print("Recording finished.")
-        
-        stream.stop_stream()
-        stream.close()
-        
-        return np.concatenate(frames, axis=0)
-
-    def recognize_speech(self):
-        """Optimized speech recognition"""
-        try:
-            # Record audio
-            audio_data = self.record_audio(duration=3)  # Reduced duration for faster response
-            
-            # Run Whisper inference
-            segments, _ = self.model.transcribe(
-                audio_data,
-                language='en',
-                beam_size=2,  # Reduced beam size for speed
-                vad_filter=True,  # Voice activity detection
-                vad_parameters=dict(min_silence_duration_ms=300),
-            )
-            
-            # Get the transcribed text
-            recognized_text = " ".join([segment.text for segment in segments]).strip()
-            
-            if recognized_text:
-                print(f"Recognized: {recognized_text}")
-                return recognized_text
-            return None
-            
-        except Exception as e:
-            print(f"Error in speech recognition: {str(e)}")
-            return None
-
-    def process_ollama_response(self, user_input):
-        """Process Ollama response in a separate thread"""
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are Immy, a magical AI-powered teddy bear who loves to chat with children. "
-                    "You are kind, funny, and full of wonder, always ready to tell stories, answer questions, "
-                    "and offer friendly advice. When speaking, you are playful, patient, and use simple, "
-                    "child-friendly language. You encourage curiosity, learning, and imagination."
-                    "Dont use emojis in your responses. "
-                )
-            },
-            {
-                "role": "user",
-                "content": user_input
-            }
-        ]
-
-        payload = {
-            "model": "qwen2.5:0.5b",
-            "messages": messages,
-            "stream": False
-        }
+        # Every spoken turn is logged locally and synced to LLM in a Box once online
+        self.log = ConversationLog()
+        self.pipeline = Pipeline(
+            stt=self.stt,
+            llm=self.llm,
+            tts=CachedTTS(self.tts),
+            on_turn_end=self.log.append,
+            # Remember earlier exchanges within a token budget
+            conversation=ConversationContext(),
+            # Per-turn latency traces and p50/p95 metrics
+            tracer=TurnTracer(),
+            # Start Ollama on Whisper's hypothesis as soon as the child pauses
+            on_partial=self.show_partial,
+            speculate=True,
+        )
+        self.pipeline.start()
+        preload([self.stt, self.llm, self.tts], timer)
+        timer.mark("pipeline")
 
-        try:
-            response = requests.post(self.OLLAMA_API_URL, json=payload, timeout=5)
-            response.raise_for_status()
-            response_text = response.json().get('message', {}).get('content', '')
-            self.response_queue.put(response_text)
-        except Exception as e:
-            print(f"Error with Ollama API: {str(e)}")
-            self.response_queue.put(None)
+    def show_partial(self, text, stable):
+        """Print what Whisper has heard so far"""
+        print(f"Hearing: {text}")
 
     def start_recording(self):
         """Handle recording and response generation"""
@@ -178,31 +63,28 @@ class SpeechBot:
         self.record_button.config(state='disabled', text="Listening...")
         self.window.update()
         
-        # Get speech input
-        user_input = self.recognize_speech()
+        # Get speech input and start replying on the pipeline threads
+        turn = self.pipeline.listen_and_respond()
         
-        if user_input:
-            # Start Ollama processing in separate thread
-            threading.Thread(
-                target=self.process_ollama_response,
-                args=(user_input,),
-                daemon=True
-            ).start()
-            
-            # Wait for response with timeout
-            try:
-                response_text = self.response_queue.get(timeout=10)
-                if response_text:
-                    self.text_to_speech(response_text)
-                else:
-                    messagebox.showerror("Error", "No response received")
-            except Exception:
-                messagebox.showerror("Error", "Response timeout")
-        
-        # Reset button state
+        # Reset button state; pressing it while Immy talks interrupts her
         self.record_button.config(state='normal', text="Start Talking")
         self.window.update()
 
+        if turn:
+            # The reply is spoken sentence by sentence as Ollama streams it
+            self.check_reply(turn)
+
+    def check_reply(self, turn):
+        """Report a failed reply once it is over, without blocking the window"""
+        if not turn.wait(0):
+            self.window.after(100, self.check_reply, turn)
+        elif turn.cancelled.is_set():
+            return  # Interrupted by a new question
+        elif isinstance(turn.error, TimeoutError):
+            messagebox.showerror("Error", "Response timeout")
+        elif turn.error or not turn.response_text:
+            messagebox.showerror("Error", "No response received")
+
     def create_gui(self):
         """Create the GUI with improved responsiveness"""
         self.window = tk.Tk()
@@ -236,17 +118,26 @@ class SpeechBot:
             fg="white"
         )
         self.record_button.pack(pady=20)
+        timer.responsive()
         
         self.window.mainloop()
 
     def cleanup(self):
         """Cleanup resources"""
-        self.audio.terminate()
-        self.engine.stop()
+        if self.llm.wait(0):
+            stats = self.llm.stats()
+            print(f"Ollama first token: warm p50 {stats['warm_first_token_p50']} s over {stats['warm_turns']} turns, "
+                  f"cold p50 {stats['cold_first_token_p50']} s over {stats['cold_turns']} turns")
+        report_connections([self.llm])
+        buffers = self.pipeline.stats()
+        print(f"Buffer high-water marks: {buffers['text']['high_water_items']} text pieces, "
+              f"{buffers['audio']['high_water_bytes'] // 1024} KB synthesized audio")
+        self.pipeline.close()
+        self.log.close()
 
 if __name__ == "__main__":
     bot = SpeechBot()
     try:
         bot.create_gui()
     finally:
-        bot.cleanup()
\ No newline at end of file
+        bot.cleanup()
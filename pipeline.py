@@ -0,0 +1,454 @@
+"""Overlapped recognize → generate → speak pipeline shared by every Immy entry point.
+
+The STT, LLM and TTS backends are pluggable (see stt.py, llm.py and tts.py).
+Generation and synthesis run on their own threads and are connected by a text
+queue, so the first sentence of a reply is synthesized and played while the
+LLM is still producing the rest of it. Up to ``tts_concurrency`` pieces are
+synthesized in parallel while an earlier one plays, and their audio is handed
+to the player strictly in reply order.
+
+With ``speculate=True`` the LLM is started on the recognizer's partial
+hypothesis as soon as the speaker pauses. Its output is held back until the
+final transcript confirms the hypothesis, and discarded otherwise.
+
+With a ``conversation`` the earlier exchanges are sent along with every
+utterance and each spoken reply is added to it.
+
+Starting a new turn interrupts the one still under way (barge-in): its LLM
+and TTS streams are aborted, its pending text and audio are dropped and
+playback stops within one audio callback period.
+
+Every hand-off is bounded (see buffers.py): at most TEXT_QUEUE_SIZE pieces
+of text wait for synthesis and at most AUDIO_BUFFER_MAX_MB of synthesized
+audio waits for the player, so a long story or a stalled speaker slows the
+LLM and TTS streams down instead of growing memory. ``stats()`` reports the
+high-water marks.
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_player import AudioStreamPlayer
+from buffers import CLOSED, BoundedBuffer, BufferUsage
+from cancellation import CancelToken
+from segmenter import SentenceSegmenter
+
+# Marker placed on the text queue once the LLM has finished a reply
+END_OF_TURN = None
+
+# Placed on the playback queue to stop the playback thread
+_SHUTDOWN = object()
+
+# Ends the audio of one synthesis job
+_DONE = object()
+
+
+def _same_utterance(a, b):
+    words = lambda text: re.sub(r"[^\w\s']", "", text.lower()).split()
+    return words(a) == words(b)
+
+
+class Turn:
+    """Handle for one exchange flowing through the pipeline"""
+
+    def __init__(self, user_input, held=False, started=None):
+        self.user_input = user_input
+        self.response_text = ""
+        self.error = None
+        self.trace_id = uuid.uuid4().hex[:16]
+        # When listening began, or when the turn was created for typed input
+        self.started = started or time.monotonic()
+        # Seconds from the start of the turn to each stage it reached
+        self.timings = {}
+        self.generated = threading.Event()
+        self.spoken = threading.Event()
+        # Backends hook their aborts into this (see cancellation.py)
+        self.cancelled = CancelToken()
+
+        # Speculative turns keep their text here until released
+        self.held = [] if held else None
+        self.lock = threading.Lock()
+
+    def mark(self, stage):
+        """Record when a stage was first reached"""
+        self.timings.setdefault(stage, time.monotonic() - self.started)
+
+    def wait(self, timeout=None):
+        """Wait until the reply has been generated and played"""
+        return self.spoken.wait(timeout)
+
+    def cancel(self):
+        """Stop generating and drop anything not yet handed to TTS"""
+        # Set first: it releases a producer blocked on a full buffer while holding the lock
+        self.cancelled.set()
+        with self.lock:
+            self.held = None
+        self.spoken.set()
+
+
+class _SynthesisJob:
+    """Audio for one piece of the reply, synthesized ahead of playback"""
+
+    def __init__(self, turn, text, max_bytes=None, usage=None):
+        self.turn = turn
+        self.text = text
+        # Only audio counts towards the limit, markers and errors always fit
+        self.chunks = BoundedBuffer(max_bytes=max_bytes, usage=usage,
+                                    size=lambda item: len(item) if isinstance(item, bytes) else 0)
+
+    def run(self, tts):
+        # An interrupted turn's audio is dropped and a blocked run() released
+        unregister = self.turn.cancelled.on_cancel(lambda: self.chunks.close(drop=True))
+        if self.turn.cancelled.is_set():
+            return
+        stream = None
+        try:
+            # Inside the try: a backend can fail when called, e.g. a Deferred
+            # that failed to load, and playback must still get _DONE
+            stream = tts.synthesize(self.text)
+            for audio_chunk in stream:
+                self.turn.mark("tts_first_byte")
+                # Blocks while this job's share of the audio budget is full,
+                # which stops reading from the TTS backend until playback catches up
+                if not self.chunks.put(audio_chunk):
+                    break
+        except Exception as e:
+            self.chunks.put(e)
+        finally:
+            # Closing the generator closes the backend's HTTP stream or process
+            if hasattr(stream, "close"):
+                stream.close()
+            self.chunks.put(_DONE)
+            unregister()
+
+    def __iter__(self):
+        while True:
+            item = self.chunks.get()
+            if item is _DONE or item is CLOSED:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class Pipeline:
+    def __init__(self, stt, llm, tts, player=None, on_error=None, segmenter=SentenceSegmenter,
+                 tts_concurrency=None, on_partial=None, speculate=False, on_turn_end=None,
+                 conversation=None, tracer=None):
+        self.stt = stt
+        self.llm = llm
+        self.tts = tts
+        self.player = player or AudioStreamPlayer()
+        # Called once per turn to split the reply into TTS-sized pieces
+        self.segmenter = segmenter
+        self.on_error = on_error
+        self.on_partial = on_partial
+        self.speculate = speculate
+        # Called with every finished turn, failed ones included, e.g. to log it
+        self.on_turn_end = on_turn_end
+        # Earlier exchanges sent along with each utterance (see conversation.py)
+        self.conversation = conversation
+        # Records per-turn spans and latency metrics (see tracing.py)
+        self.tracer = tracer
+
+        # Pieces of text waiting for synthesis; a full queue pauses the LLM stream
+        self.text_usage = BufferUsage()
+        self.text_queue = BoundedBuffer(
+            max_items=int(os.getenv("TEXT_QUEUE_SIZE", "16")),
+            size=lambda item: len(item[1].encode()) if isinstance(item[1], str) else 0,
+            usage=self.text_usage,
+        )
+
+        # Synthesis requests allowed in flight: the piece playing plus those prefetched
+        self.tts_concurrency = tts_concurrency or int(os.getenv("TTS_CONCURRENCY", "3"))
+        self._executor = ThreadPoolExecutor(max_workers=self.tts_concurrency, thread_name_prefix="tts")
+        self._playback_queue = queue.Queue(maxsize=max(1, self.tts_concurrency - 1))
+
+        # Synthesized audio not yet handed to the player, over all jobs. Each job
+        # gets an equal share: a shared pool could be filled by later pieces while
+        # playback waits on the earlier one
+        self.audio_usage = BufferUsage()
+        audio_max_bytes = int(float(os.getenv("AUDIO_BUFFER_MAX_MB", "2")) * 1024 * 1024)
+        self._job_max_bytes = audio_max_bytes // self.tts_concurrency
+
+        # Turns started and not yet spoken or cancelled, and the one on the speaker
+        self._active = set()
+        self._playing = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Open the audio output; it plays as soon as PCM arrives
+        self.player.start()
+
+        # Start text-to-speech dispatch and in-order playback threads
+        self.tts_thread = threading.Thread(target=self._tts_worker, daemon=True)
+        self.tts_thread.start()
+        self.playback_thread = threading.Thread(target=self._playback_worker, daemon=True)
+        self.playback_thread.start()
+
+    def listen_and_respond(self):
+        """Recognize one utterance and start replying to it"""
+        # The child wants to talk: stop Immy first so she does not talk over them
+        self.interrupt()
+        speculative = []
+
+        def on_partial(text, stable):
+            if self.on_partial:
+                self.on_partial(text, stable)
+            if not (self.speculate and stable and text):
+                return
+            if speculative and _same_utterance(speculative[-1].user_input, text):
+                return
+            if speculative:
+                speculative[-1].cancel()
+            speculative.append(self._start_turn(Turn(text, held=True, started=started)))
+
+        started = time.monotonic()
+        try:
+            user_input = self.stt.recognize(on_partial=on_partial)
+        except Exception as e:
+            # A deferred backend that failed to load raises its load error here
+            for turn in speculative:
+                turn.cancel()
+            turn = Turn("", started=started)
+            turn.mark("stt_end")
+            return self._failed_turn(turn, e, "speech recognition")
+        # Backends that wait for a wake word report when the speech began;
+        # the turn starts there, not at the idle wait before it
+        speech_started = getattr(self.stt, "speech_started", None) or 0.0
+        started += speech_started
+        stt_end = time.monotonic() - started
+        # Backends that know how long the microphone was open report it
+        capture_seconds = getattr(self.stt, "capture_seconds", None)
+
+        def mark_recognition(turn):
+            if turn.started != started:
+                # A speculative turn started on the old clock
+                shift = started - turn.started
+                turn.started = started
+                for stage, seconds in list(turn.timings.items()):
+                    turn.timings[stage] = max(0.0, seconds - shift)
+            if capture_seconds is not None:
+                turn.timings["capture_end"] = max(0.0, min(capture_seconds - speech_started, stt_end))
+            turn.timings["stt_end"] = stt_end
+
+        if speculative:
+            turn = speculative[-1]
+            if user_input and _same_utterance(turn.user_input, user_input):
+                # The guess was right: the reply is already under way
+                mark_recognition(turn)
+                self._release(turn)
+                return turn
+            turn.cancel()
+
+        if user_input:
+            turn = Turn(user_input, started=started)
+            mark_recognition(turn)
+            return self._start_turn(turn)
+        if not getattr(self.stt, "no_speech", False):
+            # Speech was heard but not recognized: a failed turn for the traces
+            # and metrics; the backend has already told the user
+            turn = Turn("", started=started)
+            mark_recognition(turn)
+            self._failed_turn(turn, RuntimeError("speech not recognized"))
+        return None
+
+    def respond(self, user_input):
+        """Start generating and speaking a reply without blocking the caller"""
+        self.interrupt()
+        return self._start_turn(Turn(user_input))
+
+    def interrupt(self):
+        """Cancel every turn still generating or speaking; returns True if there was one"""
+        with self._lock:
+            turns = list(self._active)
+        for turn in turns:
+            turn.cancel()
+        return bool(turns)
+
+    def _failed_turn(self, turn, error, stage=None):
+        """End a turn that failed before reaching the speaker"""
+        if stage:
+            print(f"Error in {stage}: {error}")
+        turn.error = error
+        if self.on_error:
+            self.on_error(turn, error)
+        turn.generated.set()
+        self._finish_turn(turn)
+        return turn
+
+    def _finish_turn(self, turn):
+        """Trace, remember and report a turn that is over, spoken or failed"""
+        if self.tracer is not None:
+            self.tracer.record(turn)
+        if self.conversation is not None and not turn.error:
+            self.conversation.add(turn.user_input, turn.response_text)
+        turn.spoken.set()
+        if self.on_turn_end:
+            try:
+                self.on_turn_end(turn)
+            except Exception as e:
+                print(f"Error in turn end handler: {e}")
+
+    def _start_turn(self, turn):
+        with self._lock:
+            self._active.add(turn)
+        turn.cancelled.on_cancel(lambda: self._cancelled(turn))
+        threading.Thread(target=self._llm_worker, args=(turn,), daemon=True).start()
+        return turn
+
+    def _cancelled(self, turn):
+        with self._lock:
+            self._active.discard(turn)
+            playing = self._playing is turn
+        # Release an LLM worker blocked on the full queue and drop its text
+        self.text_queue.purge(lambda item: item[0] is turn)
+        if playing:
+            # Silence the speaker now rather than after the buffered audio
+            self.player.interrupt()
+
+    def _llm_worker(self, turn):
+        segmenter = self.segmenter()
+        parts = []
+        turn.mark("llm_start")
+        history = self.conversation.history() if self.conversation is not None else None
+        stream = None
+        try:
+            # Inside the try: a deferred backend that failed to load raises here
+            stream = self.llm.stream(turn.user_input, history=history, cancel=turn.cancelled)
+            for content in stream:
+                if turn.cancelled.is_set():
+                    break
+                turn.mark("first_token")
+                parts.append(content)
+                for segment in segmenter.feed(content):
+                    self._dispatch(turn, segment)
+            else:
+                # Speak whatever is left, even without terminal punctuation
+                for segment in segmenter.flush():
+                    self._dispatch(turn, segment)
+        except Exception as e:
+            if not turn.cancelled.is_set():
+                print(f"Error in {self.llm.name} call: {e}")
+                turn.error = e
+                if self.on_error:
+                    self.on_error(turn, e)
+        finally:
+            # Closing the generator closes the backend's HTTP stream
+            if stream is not None:
+                stream.close()
+            turn.response_text = "".join(parts)
+            turn.mark("last_token")
+            turn.generated.set()
+            self._dispatch(turn, END_OF_TURN)
+
+    def _dispatch(self, turn, segment):
+        """Hand one finished piece of the reply to the TTS stage"""
+        with turn.lock:
+            if turn.cancelled.is_set():
+                return
+            if turn.held is not None:
+                turn.held.append(segment)
+                return
+            self._put_text(turn, segment)
+
+    def _release(self, turn):
+        """Let a confirmed speculative turn through to TTS"""
+        with turn.lock:
+            for segment in turn.held or []:
+                self._put_text(turn, segment)
+            turn.held = None
+
+    def _put_text(self, turn, segment):
+        # Blocks while the TTS stage is behind, which pauses reading the LLM stream
+        if not self.text_queue.put((turn, segment), cancelled=turn.cancelled):
+            return
+        if segment is END_OF_TURN:
+            sys.stdout.write("\n")
+        else:
+            sys.stdout.write(segment + " ")
+        sys.stdout.flush()
+
+    def _tts_worker(self):
+        while True:
+            # Blocks until the LLM produces text; no polling while idle
+            item = self.text_queue.get()
+
+            if item is CLOSED:
+                self._playback_queue.put((None, _SHUTDOWN))
+                break
+            turn, segment = item
+            if turn.cancelled.is_set():
+                # Interrupted: nothing more of this turn is synthesized
+                continue
+            if segment is END_OF_TURN:
+                self._playback_queue.put((turn, segment))
+                continue
+
+            # Blocks once enough pieces are already synthesizing ahead of playback
+            job = _SynthesisJob(turn, segment, self._job_max_bytes, self.audio_usage)
+            self._playback_queue.put((turn, job))
+            self._executor.submit(job.run, self.tts)
+
+    def _playback_worker(self):
+        while True:
+            turn, job = self._playback_queue.get()
+
+            if job is _SHUTDOWN:
+                break
+
+            if job is END_OF_TURN:
+                if not turn.cancelled.is_set():
+                    self.player.wait_until_done()
+                with self._lock:
+                    self._playing = None
+                    self._active.discard(turn)
+                if turn.cancelled.is_set():
+                    continue
+                turn.mark("playback_end")
+                self._finish_turn(turn)
+                continue
+
+            with self._lock:
+                if turn.cancelled.is_set():
+                    continue
+                self._playing = turn
+
+            # Jobs are consumed in reply order; later ones keep synthesizing meanwhile
+            try:
+                for audio_chunk in job:
+                    if turn.cancelled.is_set():
+                        break
+                    turn.mark("playback_start")
+                    self.player.add_audio_chunk(audio_chunk)
+            except Exception as e:
+                print(f"Error in text-to-speech conversion: {e}")
+            if turn.cancelled.is_set():
+                # A chunk may have gone in while the buffer was being cleared
+                self.player.interrupt()
+                with self._lock:
+                    self._playing = None
+
+    def stats(self):
+        """What the text and audio buffers hold now and at most, to size them per device"""
+        stats = {
+            "text": dict(self.text_usage.stats(), max_items=self.text_queue.max_items),
+            "audio": dict(self.audio_usage.stats(), max_bytes=self._job_max_bytes * self.tts_concurrency),
+        }
+        if hasattr(self.player, "stats"):
+            stats["player"] = self.player.stats()
+        return stats
+
+    def close(self):
+        """Stop the pipeline threads and release backend resources"""
+        self.text_queue.close(drop=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.player.stop()
+        for backend in (self.stt, self.llm, self.tts):
+            if hasattr(backend, "close"):
+                backend.close()
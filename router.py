@@ -0,0 +1,324 @@
+"""Routing between online and offline LLM backends.
+
+``LLMRouter`` is itself an LLM backend (``stream(user_input, history, cancel)``)
+that sends each turn to the first healthy backend in preference order,
+usually Groq or LLM in a Box with a local Ollama behind it:
+
+- every backend has a rolling window of outcomes and first-token latencies;
+- when the preferred backend has not produced a first token by the hedge
+  deadline, the next backend is asked as well and whichever answers first is
+  spoken, the other is abandoned;
+- a backend that fails before its first token is failed over immediately;
+- repeated failures trip a circuit breaker so a dead backend is skipped
+  instead of retried on every turn. A background prober (``probe()`` on the
+  backend, if it has one) closes the breaker again once it recovers;
+  otherwise a single trial turn is let through after ``reset_timeout``.
+
+Cancelling a turn aborts every backend still working on it; an interrupted
+request counts neither for nor against a backend's health.
+"""
+import os
+import time
+import queue
+import threading
+from collections import deque
+from typing import Iterator
+
+from cancellation import CancelToken
+
+_TOKEN = "token"
+_DONE = "done"
+_ERROR = "error"
+_CANCELLED = "cancelled"
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a request may be sent; in half-open state only one at a time"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        """Returns True if this failure opened the breaker"""
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+    def release(self):
+        """Give back a half-open trial whose outcome is unknown"""
+        with self._lock:
+            self._trial = False
+
+
+class BackendHealth:
+    """Rolling error rate and first-token latency of one backend"""
+
+    def __init__(self, backend, window=20, failure_threshold=3, reset_timeout=30.0):
+        self.backend = backend
+        # Read once: asking a Deferred backend for more would load it, or
+        # re-raise the error it failed to load with
+        self.name = getattr(backend, "name", type(backend).__name__)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.outcomes = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_success(self, first_token_latency=None):
+        with self._lock:
+            self.outcomes.append(True)
+            if first_token_latency is not None:
+                self.latencies.append(first_token_latency)
+        self.breaker.record_success()
+
+    def record_failure(self, reason):
+        with self._lock:
+            self.outcomes.append(False)
+        if self.breaker.record_failure():
+            print(f"{self.name} is failing ({reason}), skipping it for {self.breaker.reset_timeout:.0f}s")
+
+    def error_rate(self):
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def latency(self, quantile):
+        """First-token latency at the given quantile, or None without samples"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+    def stats(self):
+        return {
+            "state": self.breaker.state,
+            "requests": len(self.outcomes),
+            "error_rate": self.error_rate(),
+            "first_token_p50": self.latency(0.5),
+            "first_token_p95": self.latency(0.95),
+        }
+
+
+class _Attempt:
+    """One backend streaming a reply into the router's event queue"""
+
+    def __init__(self, health, user_input, history, events):
+        self.health = health
+        self.events = events
+        self.started = time.monotonic()
+        self.first_token_latency = None
+        self.finished = False
+        self.recorded = False
+        self.cancelled = CancelToken()
+        threading.Thread(target=self._run, args=(user_input, history), daemon=True).start()
+
+    def _run(self, user_input, history):
+        stream = None
+        try:
+            # A Deferred backend that failed to load raises its load error
+            # here, which fails this attempt like any other error
+            stream = self.health.backend.stream(user_input, history=history, cancel=self.cancelled)
+            for content in stream:
+                if self.cancelled.is_set():
+                    break
+                self.events.put((self, _TOKEN, content))
+            else:
+                self.events.put((self, _DONE, None))
+        except Exception as e:
+            self.events.put((self, _ERROR, e))
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class LLMRouter:
+    """LLM backend that routes, hedges and fails over between other backends"""
+
+    name = "LLM router"
+
+    def __init__(self, backends, hedge_after=None, min_hedge_after=0.5, probe_interval=None,
+                 failure_threshold=None, reset_timeout=None, window=20):
+        failure_threshold = failure_threshold or int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+        reset_timeout = reset_timeout or float(os.getenv("LLM_BREAKER_RESET", "30"))
+        self.backends = [BackendHealth(backend, window, failure_threshold, reset_timeout) for backend in backends]
+        # Seconds to wait for the preferred backend's first token before asking the next one
+        self.hedge_after = hedge_after or float(os.getenv("LLM_HEDGE_AFTER", "1.5"))
+        self.min_hedge_after = min_hedge_after
+        self.probe_interval = probe_interval or float(os.getenv("LLM_PROBE_INTERVAL", "15"))
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._probe_loop, daemon=True).start()
+
+    def stream(self, user_input: str, history=None, cancel=None) -> Iterator[str]:
+        events = queue.Queue()
+        attempts = []
+        if cancel is None:
+            cancel = CancelToken()
+        # Wakes the loops below, which then abort every attempt on the way out
+        unregister = cancel.on_cancel(lambda: events.put((None, _CANCELLED, None)))
+
+        def launch():
+            for health in self.backends:
+                if any(attempt.health is health for attempt in attempts):
+                    continue
+                if health.breaker.allow():
+                    attempt = _Attempt(health, user_input, history, events)
+                    attempts.append(attempt)
+                    return attempt
+            return None
+
+        primary = launch()
+        if primary is None:
+            unregister()
+            raise RuntimeError("no LLM backend available")
+
+        winner = None
+        last_error = None
+        hedge_at = primary.started + self._hedge_after(primary.health)
+        hedged = False
+        try:
+            # Race for the first token
+            while winner is None:
+                timeout = None if hedged else max(0.0, hedge_at - time.monotonic())
+                try:
+                    attempt, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedged = True
+                    hedge = launch()
+                    if hedge is not None:
+                        print(f"No first token from {primary.health.name} after "
+                              f"{time.monotonic() - primary.started:.1f}s, asking {hedge.health.name} too")
+                    continue
+
+                if kind is _CANCELLED:
+                    return
+                if kind is _ERROR:
+                    attempt.finished = attempt.recorded = True
+                    attempt.health.record_failure(value)
+                    last_error = value
+                    if not any(not other.finished for other in attempts):
+                        # Nothing left in flight: fail over to the next backend
+                        hedged = True
+                        failover = launch()
+                        if failover is None:
+                            raise last_error
+                        print(f"Error in {attempt.health.name} call: {value}, trying {failover.health.name}")
+                    continue
+
+                winner = attempt
+                winner.first_token_latency = time.monotonic() - winner.started
+                for other in attempts:
+                    if other is not winner:
+                        other.cancel()
+                if kind is _DONE:
+                    # An empty reply still counts as an answer
+                    winner.finished = winner.recorded = True
+                    winner.health.record_success(winner.first_token_latency)
+                    return
+                yield value
+
+            # Stream the rest of the winning reply
+            while True:
+                attempt, kind, value = events.get()
+                if kind is _CANCELLED:
+                    return
+                if attempt is not winner:
+                    continue
+                if kind is _TOKEN:
+                    yield value
+                    continue
+                winner.finished = winner.recorded = True
+                if kind is _DONE:
+                    winner.health.record_success(winner.first_token_latency)
+                    return
+                winner.health.record_failure(value)
+                raise value
+        finally:
+            unregister()
+            for attempt in attempts:
+                attempt.cancel()
+                if attempt.recorded:
+                    continue
+                if cancel.is_set():
+                    # Interrupted by the user, not the backend's fault
+                    attempt.health.breaker.release()
+                elif attempt is winner:
+                    # Closed by the caller mid-reply; it was answering fine
+                    attempt.health.record_success(attempt.first_token_latency)
+                else:
+                    # Lost the race or abandoned unanswered: slower is not broken,
+                    # and timeouts and errors are recorded where they happen
+                    attempt.health.breaker.release()
+
+    def _hedge_after(self, health):
+        # Hedge at the backend's own p95 once it has a history, never later than configured
+        p95 = health.latency(0.95)
+        if p95 is None or len(health.latencies) < 10:
+            return self.hedge_after
+        return min(self.hedge_after, max(self.min_hedge_after, p95))
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            for health in self.backends:
+                if health.breaker.state == CircuitBreaker.CLOSED:
+                    continue
+                try:
+                    probe = getattr(health.backend, "probe", None)
+                except Exception:
+                    # A backend that failed to load has nothing to probe; its
+                    # breaker lets a trial turn through after reset_timeout
+                    continue
+                if probe is None:
+                    continue
+                try:
+                    probe()
+                except Exception:
+                    health.breaker.record_failure()
+                    continue
+                print(f"{health.name} is reachable again")
+                health.breaker.record_success()
+
+    def stats(self):
+        return {health.name: health.stats() for health in self.backends}
+
+    def close(self):
+        self._stop.set()
+        for health in self.backends:
+            if hasattr(health.backend, "close"):
+                health.backend.close()
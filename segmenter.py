@@ -0,0 +1,106 @@
+"""Latency-aware splitting of streamed LLM text into TTS-sized pieces.
+
+The first piece of a reply is cut eagerly at the first clause boundary so
+speech can start after a few words. Later pieces are cut at sentence
+boundaries and grouped into larger chunks, which sound more natural and cost
+fewer TTS requests. No piece is longer than ``max_chars``, and whatever is
+left when the LLM stops is returned by ``flush()`` whether or not it ends in
+punctuation.
+
+Tokens are kept in a list and only joined and scanned when they could have
+completed a boundary, so feeding a token is cheap.
+"""
+import re
+from typing import List
+
+# Punctuation counts as a boundary only once whitespace follows it, so "3.5"
+# or "Mr.Bear" are never split while their tokens are still arriving
+SENTENCE_BOUNDARY = re.compile(r'[.!?]+["\')\]]*\s+')
+CLAUSE_BOUNDARY = re.compile(r'(?:[,;:]|\s[-–—])["\')\]]*\s+')
+ANY_BOUNDARY = re.compile(f"{SENTENCE_BOUNDARY.pattern}|{CLAUSE_BOUNDARY.pattern}")
+WHITESPACE = re.compile(r'\s+')
+
+
+class SentenceSegmenter:
+    def __init__(self, first_min_chars=15, first_max_chars=80, min_chars=60, max_chars=240):
+        self.first_min_chars = first_min_chars
+        self.first_max_chars = first_max_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.first = True
+        self._parts = []
+        self._length = 0
+
+    def feed(self, token: str) -> List[str]:
+        """Add one streamed token and return any pieces that are ready"""
+        if not token:
+            return []
+        self._parts.append(token)
+        self._length += len(token)
+
+        # A boundary needs trailing whitespace; otherwise only the length cap can cut
+        if not any(c.isspace() for c in token) and self._length <= self._limits()[1]:
+            return []
+        return self._cut(final=False)
+
+    def flush(self) -> List[str]:
+        """Return everything still buffered once the stream has ended"""
+        return self._cut(final=True)
+
+    def _limits(self):
+        if self.first:
+            return self.first_min_chars, self.first_max_chars
+        return self.min_chars, self.max_chars
+
+    def _cut(self, final):
+        buffer = "".join(self._parts)
+        pieces = []
+        while True:
+            cut = self._find_cut(buffer, final)
+            if cut is None:
+                break
+            piece = buffer[:cut].strip()
+            buffer = buffer[cut:]
+            if piece:
+                pieces.append(piece)
+                self.first = False
+
+        self._parts = [buffer] if buffer else []
+        self._length = len(buffer)
+        return pieces
+
+    def _find_cut(self, buffer, final):
+        min_chars, max_chars = self._limits()
+        if not buffer.strip():
+            return len(buffer) if final and buffer else None
+
+        if self.first:
+            # Eager: the first clause or sentence end past the minimum
+            for match in ANY_BOUNDARY.finditer(buffer, 0, max_chars + 1):
+                if match.start() + 1 >= min_chars:
+                    return match.end()
+        else:
+            # Larger chunks: the last sentence end that fits under the cap
+            cut = None
+            for match in SENTENCE_BOUNDARY.finditer(buffer, 0, max_chars + 1):
+                if match.start() + 1 >= min_chars:
+                    cut = match.end()
+            if cut is not None:
+                return cut
+
+        if len(buffer) > max_chars:
+            return self._forced_cut(buffer, max_chars)
+        if final:
+            return len(buffer)
+        return None
+
+    def _forced_cut(self, buffer, max_chars):
+        """Cut an over-long piece at the best boundary under the cap"""
+        for pattern in (SENTENCE_BOUNDARY, CLAUSE_BOUNDARY, WHITESPACE):
+            cut = None
+            for match in pattern.finditer(buffer, 0, max_chars + 1):
+                if match.start() > 0:
+                    cut = match.end()
+            if cut is not None:
+                return cut
+        return max_chars
@@ -0,0 +1,145 @@
+"""Fast cold start: deferred backend construction and startup timing.
+
+Import this module first in an entry point so its clock starts with the
+process. Heavy backends (the Whisper model, SDK clients) are wrapped in
+``Deferred`` and built on background threads while the device is already
+responsive; the first call that needs one waits for it.
+
+STARTUP_MODE=eager builds everything before the device responds, which is
+the old behaviour and useful when comparing timings.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self.phases = []  # (name, start offset, duration, background)
+        self._lock = threading.Lock()
+        self._responsive = threading.Event()
+
+    def mark(self, name):
+        """Record the foreground phase that ends now"""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((name, self._last_mark - self.started, now - self._last_mark, False))
+        self._last_mark = now
+
+    def responsive(self):
+        """Record that the device now reacts to the user"""
+        self.mark("until responsive")
+        self._responsive.set()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block, typically a background load"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, start - self.started, time.perf_counter() - start,
+                                    threading.current_thread() is not threading.main_thread()))
+
+    def report(self):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        print("Startup timing:")
+        for name, start, duration, background in phases:
+            where = "background" if background else "foreground"
+            print(f"  {name:<28} {start * 1000:8.0f} ms +{duration * 1000:7.0f} ms  ({where})")
+        print(f"  {'total':<28} {(time.perf_counter() - self.started) * 1000:8.0f} ms")
+
+
+class Deferred:
+    """Stands in for a backend whose construction is slow"""
+
+    def __init__(self, name, factory, timer=None):
+        self._name = name
+        self._factory = factory
+        self._timer = timer
+        self._backend = None
+        self._error = None
+        self._started = False
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def load_async(self):
+        """Start building the backend on a background thread"""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        threading.Thread(target=self._load, daemon=True).start()
+        return self
+
+    def get(self):
+        """The backend, built now if nobody started it yet"""
+        with self._lock:
+            load_here = not self._started
+            self._started = True
+        if load_here:
+            self._load()
+        elif not self._ready.is_set():
+            print(f"Waiting for {self._name} to load...")
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self._backend
+
+    def _load(self):
+        try:
+            if self._timer is not None:
+                with self._timer.phase(self._name):
+                    self._backend = self._factory()
+            else:
+                self._backend = self._factory()
+        except Exception as e:
+            print(f"Error loading {self._name}: {e}")
+            self._error = e
+        finally:
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @property
+    def name(self):
+        """The backend's name once it has loaded, ours until then; never waits"""
+        if self._ready.is_set() and self._error is None:
+            return getattr(self._backend, "name", self._name)
+        return self._name
+
+    def close(self):
+        if self._ready.is_set() and hasattr(self._backend, "close"):
+            self._backend.close()
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+
+def preload(backends, timer=None, mode=None):
+    """Build deferred backends in the background, or right away in eager mode
+
+    In lazy mode the timing report is printed once every backend is loaded.
+    """
+    mode = mode or os.getenv("STARTUP_MODE", "lazy")
+    backends = [backend for backend in backends if isinstance(backend, Deferred)]
+    for backend in backends:
+        if mode == "eager":
+            backend.get()
+        else:
+            backend.load_async()
+
+    if timer is not None:
+        def report_when_loaded():
+            timer._responsive.wait()
+            for backend in backends:
+                backend.wait()
+            timer.report()
+
+        threading.Thread(target=report_when_loaded, daemon=True).start()
@@ -0,0 +1,362 @@
+"""Speech-to-text backends for the Immy pipeline.
+
+Every backend exposes ``recognize(on_partial=None) -> Optional[str]`` which
+captures one utterance from the microphone and returns the recognized text,
+or None when nothing usable was heard. Backends that can transcribe while the
+speaker is still talking call ``on_partial(text, stable)`` with their current
+hypothesis; ``stable`` is True once the speaker has paused. After each call
+``capture_seconds`` holds the time from the call until the microphone closed.
+``no_speech`` is True when the call ended without hearing any speech (the
+no-speech timeout), which the pipeline does not count as a failed turn.
+A backend that first waits for something (the wake-word gate in kws.py)
+also sets ``speech_started``, the seconds from the call to the start of the
+turn's audio, and the pipeline times the turn from there.
+
+``transcribe(samples, sample_rate)`` recognizes float32 mono audio captured
+elsewhere, e.g. by the wake-word gate in kws.py.
+
+The microphone is kept open across turns by the shared ``AudioCapture``
+(capture.py); each utterance starts CAPTURE_PRE_ROLL_MS before the call so
+the first syllable is kept even if the child starts talking while pressing
+the button.
+"""
+import os
+import re
+import time
+import threading
+
+
+def _pre_roll():
+    return float(os.getenv("CAPTURE_PRE_ROLL_MS", "300")) / 1000
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class StreamingTranscriber:
+    """Transcribes an utterance incrementally while it is still being recorded
+
+    The growing capture is re-transcribed every ``interval`` seconds, and
+    immediately when the speaker pauses. Words that two consecutive passes
+    agree on are committed and the audio before them is never transcribed
+    again, so after the end of speech only a short tail is left for the final
+    pass, or nothing at all if no speech arrived since the last one.
+    """
+
+    def __init__(self, model, sample_rate=16000, interval=1.0, on_partial=None, **transcribe_options):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.on_partial = on_partial
+        self.transcribe_options = transcribe_options
+
+        self.committed = []   # (start, end, word) with absolute times
+        self.hypothesis = []  # latest uncommitted words
+        self.offset = 0.0     # seconds of audio covered by committed words
+        self._last_speech_count = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, endpointer):
+        self._thread = threading.Thread(target=self._run, args=(endpointer,), daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Run a pass now instead of waiting for the interval"""
+        self._wake.set()
+
+    def finish(self, endpointer):
+        """Stop the background passes and return the final transcript"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        audio = endpointer.audio()
+        if audio is None:
+            return ""
+        # Nothing new was said since the last pass: its hypothesis is final
+        if self._last_speech_count != endpointer.speech_count:
+            self.hypothesis = self._transcribe(audio)
+        return self._text(self.committed + self.hypothesis)
+
+    def _run(self, endpointer):
+        transcribed = 0
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            # Read the counters before the audio so they never cover speech the pass misses
+            speech_count = endpointer.speech_count
+            paused = endpointer.paused
+            audio = endpointer.audio()
+            if audio is None or len(audio) == transcribed:
+                continue
+            transcribed = len(audio)
+            try:
+                self._update(audio)
+            except Exception as e:
+                print(f"Error in partial transcription: {str(e)}")
+                continue
+            self._last_speech_count = speech_count
+            if self.on_partial:
+                self.on_partial(self._text(self.committed + self.hypothesis), paused)
+
+    def _update(self, audio):
+        words = self._transcribe(audio)
+        # Local agreement: commit the prefix this pass shares with the previous one
+        agreed = 0
+        for previous, current in zip(self.hypothesis, words):
+            if _normalize_word(previous[2]) != _normalize_word(current[2]):
+                break
+            agreed += 1
+        if agreed:
+            self.committed.extend(words[:agreed])
+            self.offset = words[agreed - 1][1]
+        self.hypothesis = words[agreed:]
+
+    def _transcribe(self, audio):
+        start = int(self.offset * self.sample_rate)
+        prompt = self._text(self.committed)
+        segments, _ = self.model.transcribe(
+            audio[start:],
+            word_timestamps=True,
+            initial_prompt=prompt or None,
+            condition_on_previous_text=False,
+            **self.transcribe_options,
+        )
+        return [
+            (word.start + self.offset, word.end + self.offset, word.word)
+            for segment in segments
+            for word in segment.words or []
+        ]
+
+    @staticmethod
+    def _text(words):
+        return "".join(word for _, _, word in words).strip()
+
+
+class GoogleSTT:
+    """Google Web Speech recognition of a VAD-endpointed capture"""
+
+    def __init__(self, listening_message="Listening...", error_message=None, capture=None, vad=None,
+                 quiet_when_silent=False):
+        import speech_recognition as sr
+        from capture import AudioCapture
+        from vad import EnergyVAD, Endpointer
+
+        self.sr = sr
+        self.recognizer = sr.Recognizer()
+        self.Endpointer = Endpointer
+        self.listening_message = listening_message
+        self.error_message = error_message
+        # Always-listening callers hear silence all the time; it is not worth a message
+        self.quiet_when_silent = quiet_when_silent
+        self.no_speech = False
+        self.capture = capture or AudioCapture.shared()
+        # Kept across turns so its noise calibration is too
+        self.vad = vad or EnergyVAD(sample_rate=self.capture.sample_rate)
+        self.capture_seconds = None
+
+    def recognize(self, on_partial=None):
+        started = time.monotonic()
+        if not (self.quiet_when_silent and self.no_speech):
+            print(self.listening_message)
+        endpointer = self.Endpointer(vad=self.vad, sample_rate=self.capture.sample_rate)
+        try:
+            for block in self.capture.listen(pre_roll=_pre_roll()):
+                if endpointer.process(block):
+                    break
+        except Exception as e:
+            print(f"Error recording: {str(e)}")
+            self.no_speech = False
+            return None
+        self.capture_seconds = time.monotonic() - started
+        audio = endpointer.audio()
+        self.no_speech = audio is None
+        if audio is None:
+            if not self.quiet_when_silent:
+                print(self.error_message or "No speech heard")
+            return None
+        return self.transcribe(audio, self.capture.sample_rate)
+
+    def transcribe(self, samples, sample_rate):
+        import numpy as np
+
+        pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes()
+        try:
+            text = self.recognizer.recognize_google(self.sr.AudioData(pcm, sample_rate, 2))
+            print(f"Recognized: {text}")
+            return text
+        except Exception as e:
+            print(self.error_message or f"Error: {str(e)}")
+            return None
+
+
+class WhisperSTT:
+    """Offline recognition with faster-whisper on a VAD-endpointed capture"""
+
+    def __init__(self, model_size="base", max_duration=10, vad=None, streaming=True, partial_interval=1.0,
+                 capture=None, worker=None):
+        from capture import AudioCapture
+        from vad import EnergyVAD, Endpointer
+
+        self.Endpointer = Endpointer
+
+        self.max_duration = max_duration
+        # Transcribe while the speaker is still talking
+        self.streaming = streaming
+        self.partial_interval = partial_interval
+        # Energy/ZCR detector unless a VAD model is plugged in, kept across
+        # turns so its noise calibration is too
+        self.vad = vad or EnergyVAD(sample_rate=16000)
+
+        # Inference runs in a worker process (stt_worker.py) unless STT_WORKER=0;
+        # either way self.model has WhisperModel's transcribe()
+        if worker is None:
+            worker = os.getenv("STT_WORKER", "1") == "1"
+        if worker and os.name != "posix":
+            # The worker inherits its socket through pass_fds, which Windows lacks
+            print("Whisper worker process not supported here, transcribing in-process")
+            worker = False
+        print("Loading Whisper model...")
+        if worker:
+            from stt_worker import WhisperWorker
+
+            self.model = WhisperWorker(model_size, sample_rate=16000, max_duration=max_duration)
+        else:
+            from faster_whisper import WhisperModel
+
+            self.model = WhisperModel(
+                model_size,
+                device="cpu" if self.is_cuda_available() else "cpu",
+                compute_type="int8" if self.is_cuda_available() else "int8",
+                cpu_threads=os.cpu_count() or 1,
+                num_workers=1,
+            )
+        print("Whisper model loaded!")
+
+        self.RATE = 16000
+        # The microphone stays open between turns
+        self.capture = capture or AudioCapture.shared()
+        self.capture_seconds = None
+        self.no_speech = False
+        self._recognize_started = None
+
+    def close(self):
+        if hasattr(self.model, "close"):
+            self.model.close()
+
+    def is_cuda_available(self):
+        """Check if CUDA is available"""
+        try:
+            import torch
+            return torch.cuda.is_available()
+        except ImportError:
+            return False
+
+    def record_audio(self, max_duration=10, endpointer=None, transcriber=None):
+        """Record until the speaker stops talking, or None if nobody spoke"""
+        started = self._recognize_started or time.monotonic()
+        if endpointer is None:
+            endpointer = self.Endpointer(vad=self.vad, sample_rate=self.RATE, max_duration=max_duration)
+
+        print("Recording...")
+
+        # Record until the endpointer has heard speech followed by silence;
+        # the blocks are views into the capture buffer, starting a little
+        # before this call
+        was_paused = False
+        try:
+            for block in self.capture.listen(pre_roll=_pre_roll()):
+                if endpointer.process(block):
+                    break
+                if transcriber is not None and endpointer.paused and not was_paused:
+                    # The speaker may be done: get a hypothesis out early
+                    transcriber.wake()
+                was_paused = endpointer.paused
+        except Exception as e:
+            print(f"Error recording: {str(e)}")
+
+        print("Recording finished.")
+        self.capture_seconds = time.monotonic() - started
+
+        audio = endpointer.audio()
+        self.no_speech = audio is None
+        return audio
+
+    def recognize(self, on_partial=None):
+        """Optimized speech recognition"""
+        self._recognize_started = time.monotonic()
+        if self.streaming:
+            return self._recognize_streaming(on_partial)
+        try:
+            # Record audio
+            audio_data = self.record_audio(max_duration=self.max_duration)
+            if audio_data is None:
+                return None
+
+            # Run Whisper inference; the capture is already trimmed to speech
+            segments, _ = self.model.transcribe(
+                audio_data,
+                language='en',
+                beam_size=2,  # Reduced beam size for speed
+                vad_filter=False,
+            )
+
+            # Get the transcribed text
+            recognized_text = " ".join([segment.text for segment in segments]).strip()
+
+            if recognized_text:
+                print(f"Recognized: {recognized_text}")
+                return recognized_text
+            return None
+
+        except Exception as e:
+            print(f"Error in speech recognition: {str(e)}")
+            return None
+
+    def transcribe(self, samples, sample_rate):
+        if sample_rate != self.RATE:
+            raise ValueError(f"Whisper expects {self.RATE} Hz audio")
+        try:
+            segments, _ = self.model.transcribe(samples, language='en', beam_size=2, vad_filter=False)
+            recognized_text = " ".join([segment.text for segment in segments]).strip()
+        except Exception as e:
+            print(f"Error in speech recognition: {str(e)}")
+            return None
+        if recognized_text:
+            print(f"Recognized: {recognized_text}")
+            return recognized_text
+        return None
+
+    def _recognize_streaming(self, on_partial):
+        """Transcribe on a background thread while recording"""
+        try:
+            endpointer = self.Endpointer(vad=self.vad, sample_rate=self.RATE, max_duration=self.max_duration)
+            transcriber = StreamingTranscriber(
+                self.model,
+                sample_rate=self.RATE,
+                interval=self.partial_interval,
+                on_partial=on_partial,
+                language='en',
+                beam_size=2,
+                vad_filter=False,
+            )
+            transcriber.start(endpointer)
+            try:
+                self.record_audio(endpointer=endpointer, transcriber=transcriber)
+            finally:
+                recognized_text = transcriber.finish(endpointer)
+
+            if recognized_text:
+                print(f"Recognized: {recognized_text}")
+                return recognized_text
+            return None
+
+        except Exception as e:
+            print(f"Error in speech recognition: {str(e)}")
+            return None
@@ -0,0 +1,226 @@
+"""Whisper inference in a dedicated worker process.
+
+Transcribing in the main process let faster-whisper's threads compete with
+audio playback, the Tk loop and the Ollama request thread for the Pi's four
+cores, and the GIL-holding parts of inference stalled them outright.
+``WhisperWorker`` loads the model once in a child process and stands in for
+the ``WhisperModel`` itself: ``transcribe(audio, **options)`` returns
+``(segments, info)`` with the segments already materialized, so
+``WhisperSTT`` and ``StreamingTranscriber`` use it unchanged.
+
+Audio is not pickled: the caller copies it into a shared-memory block and
+sends only its length and the options over a socket. The block is sized for
+``max_duration`` seconds and replaced by a larger one if a longer clip comes
+along.
+
+The worker is pinned to STT_WORKER_CPUS (e.g. ``1-3``; all cores by
+default) and lowered to STT_WORKER_NICE so audio always wins a contested
+core. STT_RESERVE_AUDIO_CORE=1 keeps core 0 free of inference for capture,
+playback and the UI. Whisper gets one thread per core it may use.
+
+The worker inherits its socket through ``pass_fds``, so it needs a POSIX
+system; elsewhere ``WhisperSTT`` keeps the model in-process.
+"""
+import os
+import sys
+import atexit
+import socket
+import threading
+import subprocess
+import importlib.util
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+Word = namedtuple("Word", "start end word")
+Segment = namedtuple("Segment", "start end text words")
+
+
+def parse_cpus(spec):
+    """``"1-3,5"`` -> ``{1, 2, 3, 5}``"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def worker_cpus(spec=None, reserve_audio_core=None):
+    """The cores the worker may run on, or None where affinity is unsupported"""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    spec = spec if spec is not None else os.getenv("STT_WORKER_CPUS", "")
+    if reserve_audio_core is None:
+        reserve_audio_core = os.getenv("STT_RESERVE_AUDIO_CORE", "0") == "1"
+    available = os.sched_getaffinity(0)
+    cpus = parse_cpus(spec) & available if spec else set(available)
+    if reserve_audio_core and len(cpus) > 1:
+        cpus.discard(min(available))
+    return cpus or set(available)
+
+
+class WhisperWorker:
+    def __init__(self, model_size="base", sample_rate=16000, max_duration=10, cpus=None, nice=None):
+        self.sample_rate = sample_rate
+        self.cpus = cpus if cpus is not None else worker_cpus()
+        self.nice = nice if nice is not None else int(os.getenv("STT_WORKER_NICE", "10"))
+        threads = len(self.cpus) if self.cpus else os.cpu_count() or 1
+        self._model_options = dict(device="cpu", compute_type="int8", cpu_threads=threads, num_workers=1)
+        self.model_size = model_size
+        # Fail like an in-process WhisperModel would, without starting a worker to find out
+        if importlib.util.find_spec("faster_whisper") is None:
+            raise ImportError("No module named 'faster_whisper'")
+
+        self._lock = threading.Lock()
+        self._shm = None
+        self._allocate(int(max_duration * sample_rate) + sample_rate)
+        self._process = None
+        self._conn = None
+        try:
+            self._start()
+        except Exception:
+            self._release()
+            raise
+        # Stop the worker and free the block even if nobody calls close()
+        atexit.register(self.close)
+
+    def _allocate(self, samples):
+        self._release()
+        self._shm = shared_memory.SharedMemory(create=True, size=samples * 4)
+        self._buffer = np.ndarray((samples,), dtype=np.float32, buffer=self._shm.buf)
+
+    def _start(self):
+        # A fresh interpreter running this file: forking would copy the parent's
+        # capture and HTTP threads' state, and multiprocessing's spawn would
+        # re-run the entry script (Tk and all) in the child
+        if self._conn is not None:
+            self._conn.close()
+        parent, child = socket.socketpair()
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child.fileno())],
+            pass_fds=[child.fileno()],
+        )
+        child.close()
+        self._conn = Connection(parent.detach())
+        self._conn.send((self.model_size, self._model_options, self.cpus, self.nice))
+        # Wait for the model so a Deferred STT is only ready once it can transcribe
+        status, detail = self._receive()
+        if status == "import-error":
+            raise ImportError(f"Whisper worker failed to start: {detail}")
+        if status != "ready":
+            raise RuntimeError(f"Whisper worker failed to start: {detail}")
+
+    def _receive(self):
+        try:
+            return self._conn.recv()
+        except (EOFError, OSError):
+            raise RuntimeError(f"Whisper worker exited (code {self._process.poll()})")
+
+    def transcribe(self, audio, **options):
+        """Transcribe float32 mono audio in the worker; returns ``(segments, None)``"""
+        audio = np.asarray(audio, dtype=np.float32)
+        with self._lock:
+            if self._process.poll() is not None:
+                print("Whisper worker died, restarting it")
+                self._start()
+            if len(audio) > len(self._buffer):
+                self._allocate(len(audio))
+            self._buffer[:len(audio)] = audio
+            self._conn.send((self._shm.name, len(audio), options))
+            status, result = self._receive()
+        if status != "ok":
+            raise RuntimeError(result)
+        return result, None
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                try:
+                    self._conn.send(None)
+                    self._process.wait(timeout=2)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._process.kill()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._release()
+
+    def _release(self):
+        if self._shm is not None:
+            # Drop the array first: the block can't be closed while it is exported
+            self._buffer = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _serve(conn):
+    """Worker process: load the model, then transcribe requests until told to stop"""
+    model_size, model_options, cpus, nice = conn.recv()
+    try:
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        if nice:
+            os.nice(nice)
+        from faster_whisper import WhisperModel
+
+        model = WhisperModel(model_size, **model_options)
+    except ImportError as e:
+        conn.send(("import-error", str(e)))
+        return
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", None))
+
+    blocks = {}
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        name, length, options = request
+        try:
+            if name not in blocks:
+                # The parent replaced the block with a larger one
+                for block in blocks.values():
+                    block.close()
+                blocks = {name: shared_memory.SharedMemory(name=name)}
+                # The parent owns the block; without this our resource tracker
+                # would unlink it when the worker exits. The tracker knows POSIX
+                # blocks by their name with the leading slash that ``name`` drops
+                resource_tracker.unregister("/" + name, "shared_memory")
+            conn.send(("ok", _transcribe(model, blocks[name], length, options)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+    for block in blocks.values():
+        block.close()
+
+
+def _transcribe(model, block, length, options):
+    # The view into the block must not outlive this call, or the block can't be closed
+    audio = np.ndarray((length,), dtype=np.float32, buffer=block.buf)
+    segments, _ = model.transcribe(audio, **options)
+    return [
+        Segment(
+            segment.start,
+            segment.end,
+            segment.text,
+            [Word(word.start, word.end, word.word) for word in segment.words] if segment.words else None,
+        )
+        for segment in segments
+    ]
+
+
+if __name__ == "__main__":
+    # Serve from the imported module so results pickle as stt_worker.Segment, not __main__.Segment
+    import stt_worker
+
+    stt_worker._serve(Connection(int(sys.argv[1])))
@@ -0,0 +1,168 @@
+"""Per-turn latency traces and a Prometheus metrics file.
+
+Every turn carries a trace id and the offsets (seconds since listening began)
+at which it reached each stage; see ``Turn.timings`` in pipeline.py.
+``TurnTracer.record`` turns those into spans:
+
+    capture    0 → microphone closed
+    stt        microphone closed → transcript ready
+    llm        request sent → last token (with the first token as an event)
+    tts        first audio byte from the TTS backend (event)
+    playback   first audio handed to the player → finished playing
+
+and appends them as one JSON line to a size-rotated TRACE_DIR/traces.jsonl.
+It also keeps the last ``window`` turns per stage and rewrites
+TRACE_DIR/metrics.prom with p50/p95 summaries in the Prometheus text format,
+which node_exporter's textfile collector can pick up. Recording a turn is a
+few dictionary operations and two small writes after the reply has been
+spoken, so it stays on in production; TRACING=0 turns it off.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+DEFAULT_TRACE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "immy", "traces")
+
+# (span, start event, end event); a missing start means the start of the turn
+SPANS = (
+    ("capture", None, "capture_end"),
+    ("stt", "capture_end", "stt_end"),
+    ("llm", "llm_start", "last_token"),
+    ("playback", "playback_start", "playback_end"),
+)
+
+# Latencies summarized in the metrics file: (stage, from event, to event)
+LATENCIES = (
+    ("capture", None, "capture_end"),
+    ("stt", "capture_end", "stt_end"),
+    ("first_token", "stt_end", "first_token"),
+    ("last_token", "stt_end", "last_token"),
+    ("tts_first_byte", "stt_end", "tts_first_byte"),
+    ("first_audio", "stt_end", "playback_start"),
+    ("playback", "playback_start", "playback_end"),
+    ("total", None, "playback_end"),
+)
+
+QUANTILES = (0.5, 0.95)
+
+
+def _between(timings, start, end):
+    if end not in timings or (start is not None and start not in timings):
+        return None
+    # Speculative turns can reach a stage before the transcript is final
+    return max(0.0, timings[end] - (timings[start] if start else 0.0))
+
+
+class TurnTracer:
+    def __init__(self, trace_dir=None, max_bytes=None, backups=3, window=500, enabled=None):
+        if enabled is None:
+            enabled = os.getenv("TRACING", "1") != "0"
+        self.enabled = enabled
+        self.trace_dir = os.path.expanduser(trace_dir or os.getenv("TRACE_DIR", DEFAULT_TRACE_DIR))
+        self.metrics_path = os.path.join(self.trace_dir, "metrics.prom")
+        self.window = window
+        self.turns = 0
+        self.errors = 0
+        self._latencies = {stage: deque(maxlen=window) for stage, _, _ in LATENCIES}
+        # Running totals since start for _sum/_count, which Prometheus needs monotonic
+        self._sums = {stage: 0.0 for stage, _, _ in LATENCIES}
+        self._counts = {stage: 0 for stage, _, _ in LATENCIES}
+        self._lock = threading.Lock()
+        if not enabled:
+            return
+
+        os.makedirs(self.trace_dir, exist_ok=True)
+        max_bytes = max_bytes or int(os.getenv("TRACE_MAX_MB", "5")) * 1024 * 1024
+        handler = RotatingFileHandler(os.path.join(self.trace_dir, "traces.jsonl"),
+                                      maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._log = logging.getLogger(f"immy.traces.{id(self)}")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        self._log.addHandler(handler)
+
+    def record(self, turn):
+        """Write the trace of a finished turn and update the metrics"""
+        if not self.enabled:
+            return
+        timings = turn.timings
+        spans = {}
+        for name, start, end in SPANS:
+            if end in timings and (start is None or start in timings):
+                spans[name] = [round(timings[start] if start else 0.0, 4), round(timings[end], 4)]
+        events = {name: round(timings[name], 4) for name in ("first_token", "tts_first_byte") if name in timings}
+
+        with self._lock:
+            self.turns += 1
+            if turn.error:
+                self.errors += 1
+            for stage, start, end in LATENCIES:
+                seconds = _between(timings, start, end)
+                if seconds is not None:
+                    self._latencies[stage].append(seconds)
+                    self._sums[stage] += seconds
+                    self._counts[stage] += 1
+
+        self._log.info(json.dumps({
+            "trace_id": turn.trace_id,
+            "time": time.time(),
+            "error": str(turn.error) if turn.error else None,
+            "spans": spans,
+            "events": events,
+        }))
+        try:
+            self._write_metrics()
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    def summary(self):
+        """p50/p95 per stage over the recent window, in seconds"""
+        with self._lock:
+            latencies = {stage: sorted(values) for stage, values in self._latencies.items()}
+        return {
+            stage: {quantile: values[min(len(values) - 1, int(quantile * len(values)))] for quantile in QUANTILES}
+            for stage, values in latencies.items() if values
+        }
+
+    def _write_metrics(self):
+        with self._lock:
+            latencies = {stage: list(values) for stage, values in self._latencies.items()}
+            sums, counts = dict(self._sums), dict(self._counts)
+            turns, errors = self.turns, self.errors
+
+        lines = [
+            "# HELP immy_turn_stage_seconds Turn latency per stage: quantiles over the last turns, sum and count since start.",
+            "# TYPE immy_turn_stage_seconds summary",
+        ]
+        for stage, values in latencies.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            for quantile in QUANTILES:
+                value = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+                lines.append(f'immy_turn_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'immy_turn_stage_seconds_sum{{stage="{stage}"}} {sums[stage]:.6f}')
+            lines.append(f'immy_turn_stage_seconds_count{{stage="{stage}"}} {counts[stage]}')
+        lines += [
+            "# HELP immy_turns_total Turns finished since start, failed ones included.",
+            "# TYPE immy_turns_total counter",
+            f"immy_turns_total {turns}",
+            "# HELP immy_turn_errors_total Turns whose reply failed since start.",
+            "# TYPE immy_turn_errors_total counter",
+            f"immy_turn_errors_total {errors}",
+        ]
+
+        # Write then rename so a scraper never reads half a file
+        temp_path = f"{self.metrics_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.metrics_path)
+
+    def close(self):
+        if self.enabled:
+            for handler in self._log.handlers:
+                handler.close()
@@ -0,0 +1,258 @@
+"""Text-to-speech backends for the Immy pipeline.
+
+Every backend exposes ``synthesize(text) -> Iterator[bytes]`` which yields
+16-bit mono PCM at ``sample_rate`` for the given text as it is produced,
+ready to be handed to ``AudioStreamPlayer.add_audio_chunk``.
+"""
+import os
+import wave
+import shutil
+import struct
+import time
+import tempfile
+import threading
+import subprocess
+from io import BytesIO
+from typing import Iterator
+
+SAMPLE_WIDTH = 2  # bytes per 16-bit sample
+WAV_HEADER_BYTES = 44
+STREAM_CHUNK = 4096
+
+# tmpfs mount used for pyttsx3 renders so they never touch the SD card
+RAM_DIR = "/dev/shm"
+
+
+def wav_to_pcm(data: bytes, sample_rate: int) -> bytes:
+    """Convert a WAV file in memory to 16-bit mono PCM at sample_rate"""
+    with wave.open(BytesIO(data), "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 2 and channels == 1 and rate == sample_rate:
+        return frames
+
+    import numpy as np
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) * 256
+    else:
+        samples = np.frombuffer(frames, dtype=np.int16).astype(np.float32)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate:
+        positions = np.arange(0, len(samples), rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+class ElevenLabsTTS:
+    """Streaming synthesis through the ElevenLabs API"""
+
+    def __init__(self, api_key=None, voice_id="jBpfuIE2acCO8z3wKNLl",  # Adam pre-made voice
+                 model_id="eleven_turbo_v2_5", sample_rate=22050, base_url=None):
+        import httpx
+        from elevenlabs import VoiceSettings
+        from elevenlabs.client import ElevenLabs
+
+        # One keep-alive pool shared by the parallel synthesis requests
+        pool_size = int(os.getenv("HTTP_POOL_SIZE", "4"))
+        self.requests = 0
+        self.pings = 0
+        self.connections = 0
+        self.last_used = time.monotonic()
+        self._reachable = True
+        self._stop = threading.Event()
+        self.http = httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+                                  connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))),
+            event_hooks={"request": [self._on_request]},
+        )
+        # base_url points the client at a stand-in server, e.g. for benchmarks
+        self.base_url = base_url or "https://api.elevenlabs.io"
+        self.client = ElevenLabs(api_key=api_key or os.getenv("ELEVENLABS_API_KEY"), base_url=self.base_url,
+                                 httpx_client=self.http)
+        # Do the TLS handshake before the first reply needs it, and again
+        # whenever the connection has idled long enough to be dropped
+        from http_pool import keepalive_loop
+
+        keepalive_interval = float(os.getenv("HTTP_KEEPALIVE_INTERVAL", "30"))
+        threading.Thread(target=keepalive_loop, daemon=True,
+                         args=(self._preconnect, lambda: self.last_used, keepalive_interval, self._stop)).start()
+        self.voice_id = voice_id
+        self.model_id = model_id
+        # Raw PCM so the player can append it without decoding
+        self.output_format = f"pcm_{sample_rate}"
+        self.voice_settings = VoiceSettings(
+            stability=0.0,
+            similarity_boost=1.0,
+            style=0.0,
+            use_speaker_boost=True,
+        )
+
+    def cache_params(self):
+        return {
+            "backend": "elevenlabs",
+            "voice_id": self.voice_id,
+            "model_id": self.model_id,
+            "voice_settings": dict(self.voice_settings),
+            "output_format": self.output_format,
+        }
+
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        audio_stream = self.client.text_to_speech.convert_as_stream(
+            voice_id=self.voice_id,
+            output_format=self.output_format,
+            optimize_streaming_latency="4",
+            text=text,
+            model_id=self.model_id,
+            voice_settings=self.voice_settings,
+        )
+
+        for audio_chunk in audio_stream:
+            if audio_chunk:
+                yield audio_chunk
+
+    def _preconnect(self):
+        self.pings += 1
+        try:
+            self.http.head(f"{self.base_url}/")
+            self._reachable = True
+        except Exception as e:
+            # Only report the change, not every idle ping
+            if self._reachable:
+                print(f"Could not pre-connect to ElevenLabs: {e}")
+            self._reachable = False
+
+    def _on_request(self, request):
+        self.requests += 1
+        self.last_used = time.monotonic()
+        # httpcore reports every new connection through the trace extension
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self.connections += 1
+
+    def stats(self):
+        # Same shape as HTTPPool.stats(), pre-connects counted as pings
+        sent = self.requests
+        return {
+            "http": {
+                "requests": sent - self.pings,
+                "pings": self.pings,
+                "connections": self.connections,
+                "reuse_rate": round(1 - self.connections / sent, 3) if sent else None,
+            }
+        }
+
+    def close(self):
+        self._stop.set()
+        self.http.close()
+
+
+class Pyttsx3TTS:
+    """Offline synthesis, streamed from espeak in memory or rendered by pyttsx3"""
+
+    def __init__(self, rate=150, volume=0.9, voice_hint="female", sample_rate=22050, use_espeak=True):
+        self.sample_rate = sample_rate
+        self.rate = rate
+        self.volume = volume
+        self.engine = None
+
+        # pyttsx3 drives espeak on Linux anyway; calling it directly lets each
+        # sentence stream out of a pipe as it renders and in parallel
+        self.espeak = (shutil.which("espeak-ng") or shutil.which("espeak")) if use_espeak else None
+        if self.espeak:
+            self.voice = "en+f3" if voice_hint == "female" else "en"
+            return
+
+        import pyttsx3
+
+        # The engine is not thread-safe; prefetch workers take turns
+        self.lock = threading.Lock()
+
+        # Initialize text-to-speech engine
+        self.engine = pyttsx3.init()
+        self.engine.setProperty('rate', rate)
+        self.engine.setProperty('volume', volume)
+
+        # Setup voice
+        voices = self.engine.getProperty('voices')
+        for voice in voices:
+            if voice_hint in voice.name.lower():
+                self.engine.setProperty('voice', voice.id)
+                break
+        self.voice = self.engine.getProperty('voice')
+
+    def cache_params(self):
+        return {
+            "backend": "espeak" if self.espeak else "pyttsx3",
+            "voice_id": self.voice,
+            "rate": self.rate,
+            "volume": self.volume,
+            "output_format": f"pcm_{self.sample_rate}",
+        }
+
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        if self.espeak:
+            yield from self._stream_espeak(text)
+            return
+        with self.lock:
+            audio = self._render(text)
+        yield wav_to_pcm(audio, self.sample_rate)
+
+    def _stream_espeak(self, text):
+        process = subprocess.Popen(
+            [self.espeak, "--stdout", "-s", str(self.rate), "-a", str(int(self.volume * 100)), "-v", self.voice],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            process.stdin.write(text.encode("utf-8"))
+            process.stdin.close()
+
+            header = process.stdout.read(WAV_HEADER_BYTES)
+            if len(header) < WAV_HEADER_BYTES:
+                raise RuntimeError("espeak produced no audio")
+            channels, rate = struct.unpack_from("<HI", header, 22)
+            width = struct.unpack_from("<H", header, 34)[0] // 8
+
+            if (channels, rate, width) != (1, self.sample_rate, SAMPLE_WIDTH):
+                # Needs conversion, which is done on the whole sentence
+                yield wav_to_pcm(header + process.stdout.read(), self.sample_rate)
+                return
+
+            # Hand PCM on as soon as espeak writes it
+            while True:
+                chunk = process.stdout.read1(STREAM_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            process.stdout.close()
+            # Closed early: the turn was interrupted
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def _render(self, text):
+        # pyttsx3 can only render to a file: use a private one on a RAM disk
+        # when there is one, and read it straight back into memory
+        fd, temp_file = tempfile.mkstemp(suffix=".wav", dir=RAM_DIR if os.path.isdir(RAM_DIR) else None)
+        os.close(fd)
+        try:
+            self.engine.save_to_file(text, temp_file)
+            self.engine.runAndWait()
+            with open(temp_file, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(temp_file)
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.stop()
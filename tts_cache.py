@@ -0,0 +1,195 @@
+"""Content-addressed cache for synthesized speech.
+
+Greetings, "Couldn't catch that", error notices and other common replies are
+synthesized once and then served from a size-bounded in-memory LRU in front
+of a disk store with a byte budget. Entries are keyed on everything that
+changes the audio: backend, voice, model, voice settings, output format and
+the normalized text.
+
+Wrap any TTS backend that provides ``cache_params()``:
+
+    tts = CachedTTS(ElevenLabsTTS(), TTSCache())
+"""
+import os
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Iterator
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "immy", "tts")
+
+# Cached audio is replayed in pieces this size so it flows like a live stream
+REPLAY_CHUNK = 8192
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and unicode variants that do not change the speech"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(params: dict, text: str) -> str:
+    payload = json.dumps([params, normalize_text(text)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, cache_dir=None, memory_bytes=None, disk_bytes=None):
+        self.cache_dir = os.path.expanduser(cache_dir or os.getenv("TTS_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.memory_bytes = memory_bytes or int(os.getenv("TTS_CACHE_MEMORY_MB", "8")) * 1024 * 1024
+        self.disk_bytes = disk_bytes or int(os.getenv("TTS_CACHE_DISK_MB", "200")) * 1024 * 1024
+
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions_memory = 0
+        self.evictions_disk = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Sizing the disk store means a stat per entry, so it runs in the
+        # background instead of delaying startup; entries written meanwhile are
+        # counted by put() and skipped by the scan
+        self._disk_size = 0
+        self._indexed = threading.Event()
+        self._written_while_indexing = set()
+        threading.Thread(target=self._index, daemon=True).start()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return audio
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            # Touch so disk eviction sees it as recently used
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits_disk += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        with self._lock:
+            self._remember(key, audio)
+
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            # Write then rename so a crash never leaves a truncated entry behind
+            with open(temp_path, "wb") as f:
+                f.write(audio)
+            existed = os.path.exists(path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing TTS cache: {e}")
+            return
+
+        with self._lock:
+            if not existed:
+                self._disk_size += len(audio)
+                if not self._indexed.is_set():
+                    self._written_while_indexing.add(path)
+            if self._indexed.is_set() and self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _index(self):
+        try:
+            entries = [(path, size) for path, size, _ in self._disk_entries()]
+        except OSError as e:
+            print(f"Error reading TTS cache: {e}")
+            entries = []
+        with self._lock:
+            self._disk_size += sum(size for path, size in entries if path not in self._written_while_indexing)
+            self._written_while_indexing.clear()
+            self._indexed.set()
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.evictions_memory += 1
+
+    def _evict_disk(self):
+        # Oldest access time first, down to 90% of the budget to avoid thrashing
+        target = self.disk_bytes * 0.9
+        for path, size, _ in sorted(self._disk_entries(), key=lambda entry: entry[2]):
+            if self._disk_size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk_size -= size
+            self.evictions_disk += 1
+
+    def _disk_entries(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pcm"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "memory_bytes": self._memory_size,
+                "disk_bytes": self._disk_size,
+                "evictions_memory": self.evictions_memory,
+                "evictions_disk": self.evictions_disk,
+            }
+
+
+class CachedTTS:
+    """TTS backend wrapper that serves repeated phrases from a TTSCache"""
+
+    def __init__(self, tts, cache=None):
+        self.tts = tts
+        self.cache = cache or TTSCache()
+
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        key = cache_key(self.tts.cache_params(), text)
+        audio = self.cache.get(key)
+        if audio is not None:
+            for start in range(0, len(audio), REPLAY_CHUNK):
+                yield audio[start:start + REPLAY_CHUNK]
+            return
+
+        # Stream through while collecting; only complete audio is stored
+        chunks = []
+        for audio_chunk in self.tts.synthesize(text):
+            chunks.append(audio_chunk)
+            yield audio_chunk
+        self.cache.put(key, b"".join(chunks))
+
+    def close(self):
+        if hasattr(self.tts, "close"):
+            self.tts.close()
@@ -0,0 +1,163 @@
+"""Streaming voice activity detection and end-of-speech endpointing.
+
+``EnergyVAD`` classifies fixed-size frames from short-time energy against an
+adaptive noise floor plus zero-crossing rate, computed for a whole block of
+frames at once with NumPy. Any object with the same ``speech_frames`` method
+can be plugged in instead, e.g. ``WebRTCVAD``. The noise floor it has
+learned survives ``reset()`` for VAD_CALIBRATION_TTL seconds, so a VAD kept
+across turns does not recalibrate on every utterance.
+
+``Endpointer`` consumes captured blocks as they arrive and decides when the
+utterance is over: it keeps a short pre-roll so the first syllable is not
+lost, waits for a hangover of silence before ending, and caps the total
+length.
+"""
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+
+class EnergyVAD:
+    def __init__(self, sample_rate=16000, frame_ms=20, margin_db=12.0, min_energy_db=-60.0,
+                 max_zcr=0.35, noise_adapt=0.05, calibration_ttl=None):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.margin_db = margin_db
+        self.min_energy_db = min_energy_db
+        self.max_zcr = max_zcr
+        self.noise_adapt = noise_adapt
+        self.calibration_ttl = calibration_ttl or float(os.getenv("VAD_CALIBRATION_TTL", "300"))
+        self.noise_floor_db = None
+        self._calibrated_at = 0.0
+
+    def speech_frames(self, samples: np.ndarray) -> np.ndarray:
+        """Return one speech/non-speech flag per whole frame in samples"""
+        count = len(samples) // self.frame_length
+        if count == 0:
+            return np.zeros(0, dtype=bool)
+        frames = samples[:count * self.frame_length].reshape(count, self.frame_length)
+
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_length
+
+        if self.noise_floor_db is None:
+            # Start from the quietest frames heard so far
+            self.noise_floor_db = float(np.percentile(energy_db, 10))
+
+        threshold = max(self.noise_floor_db + self.margin_db, self.min_energy_db)
+        # Loud frames with a low crossing rate are voiced; hiss crosses zero constantly
+        speech = (energy_db > threshold) & (zcr < self.max_zcr)
+
+        # Track the noise floor on non-speech frames only
+        quiet = energy_db[~speech]
+        if len(quiet):
+            self.noise_floor_db += self.noise_adapt * (float(np.mean(quiet)) - self.noise_floor_db)
+            self._calibrated_at = time.monotonic()
+        return speech
+
+    def reset(self):
+        # Keep a recently learned noise floor instead of recalibrating
+        if time.monotonic() - self._calibrated_at > self.calibration_ttl:
+            self.noise_floor_db = None
+
+
+class WebRTCVAD:
+    """Adapter for the optional webrtcvad package (16-bit PCM, 10/20/30 ms frames)"""
+
+    def __init__(self, sample_rate=16000, frame_ms=20, aggressiveness=2):
+        import webrtcvad
+
+        self.vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+
+    def speech_frames(self, samples: np.ndarray) -> np.ndarray:
+        count = len(samples) // self.frame_length
+        pcm = (np.clip(samples[:count * self.frame_length], -1, 1) * 32767).astype(np.int16)
+        frames = pcm.reshape(count, self.frame_length)
+        return np.array([self.vad.is_speech(frame.tobytes(), self.sample_rate) for frame in frames], dtype=bool)
+
+    def reset(self):
+        pass
+
+
+class Endpointer:
+    """Collects one utterance from a stream of float32 blocks"""
+
+    def __init__(self, vad=None, sample_rate=16000, pre_roll_ms=300, hangover_ms=700,
+                 min_speech_ms=100, max_duration=10.0, no_speech_timeout=5.0):
+        self.vad = vad or EnergyVAD(sample_rate=sample_rate)
+        self.sample_rate = sample_rate
+        frame_ms = 1000 * self.vad.frame_length / sample_rate
+        self.pre_roll_frames = int(pre_roll_ms / frame_ms)
+        self.hangover_frames = int(hangover_ms / frame_ms)
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.max_samples = int(max_duration * sample_rate)
+        self.no_speech_samples = int(no_speech_timeout * sample_rate)
+        self.reset()
+
+    def reset(self):
+        self.vad.reset()
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pre_roll = deque(maxlen=self.pre_roll_frames + self.min_speech_frames)
+        self._frames = []
+        self._speech_run = 0
+        self._silence_run = 0
+        self._heard = 0
+        # Speech frames since the trigger, so callers can tell whether anything new was said
+        self.speech_count = 0
+        self.triggered = False
+        self.done = False
+
+    def process(self, block: np.ndarray) -> bool:
+        """Feed captured samples; returns True once the utterance has ended"""
+        if self.done:
+            return True
+        samples = np.concatenate((self._pending, block)) if len(self._pending) else block
+        frame_length = self.vad.frame_length
+        usable = len(samples) - len(samples) % frame_length
+        self._pending = samples[usable:]
+        self._heard += len(block)
+
+        flags = self.vad.speech_frames(samples[:usable])
+        frames = samples[:usable].reshape(-1, frame_length)
+        for frame, is_speech in zip(frames, flags):
+            if not self.triggered:
+                self._pre_roll.append(frame)
+                self._speech_run = self._speech_run + 1 if is_speech else 0
+                if self._speech_run >= self.min_speech_frames:
+                    # Speech confirmed: keep the pre-roll ahead of it
+                    self.triggered = True
+                    self._frames.extend(self._pre_roll)
+                    self._pre_roll.clear()
+                continue
+
+            self._frames.append(frame)
+            if is_speech:
+                self.speech_count += 1
+            self._silence_run = 0 if is_speech else self._silence_run + 1
+            if self._silence_run >= self.hangover_frames:
+                self.done = True
+                break
+
+        if self.triggered and len(self._frames) * frame_length >= self.max_samples:
+            self.done = True
+        if not self.triggered and self._heard >= self.no_speech_samples:
+            self.done = True
+        return self.done
+
+    @property
+    def paused(self):
+        """True once the speaker has been quiet for at least a third of the hangover"""
+        return self.triggered and self._silence_run * 3 >= self.hangover_frames
+
+    def audio(self):
+        """The captured utterance, or None if no speech was heard"""
+        # Copy first: another thread may be reading while frames are appended
+        frames = list(self._frames)
+        if not frames:
+            return None
+        return np.concatenate(frames)